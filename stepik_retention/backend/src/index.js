@@ -1,33 +1,27 @@
 const express = require('express');
 const cors = require('cors');
 const axios = require('axios');
-const path = require('path');
-const fs = require('fs');
 
 const app = express();
 const PORT = process.env.PORT || 3002;
 const MODEL_SERVICE_URL = process.env.MODEL_SERVICE_URL || 'http://stepik-retention-model:8000';
 
-// Load precomputed user features
-let usersFeatures = {};
-const featuresPath = path.join(__dirname, '..', 'data', 'users_features.json');
-
-try {
-  const data = fs.readFileSync(featuresPath, 'utf8');
-  usersFeatures = JSON.parse(data);
-  console.log(`Loaded features for ${Object.keys(usersFeatures).length} users`);
-} catch (err) {
-  console.error('Failed to load users_features.json:', err.message);
-  console.error('Run precompute_features.py first.');
-}
-
+// Precomputed user features live in the model service (users_features.bin)
 app.use(cors());
 app.use(express.json());
 
 // Get list of available user IDs for randomizer
-app.get('/api/users', (req, res) => {
-  const userIds = Object.keys(usersFeatures).map(Number);
-  res.json({ userIds });
+app.get('/api/users', async (req, res) => {
+  try {
+    const response = await axios.get(`${MODEL_SERVICE_URL}/users`, { timeout: 5000 });
+    res.json({ userIds: response.data.user_ids });
+  } catch (err) {
+    console.error('Model service error:', err.message);
+    res.status(503).json({
+      error: 'Model service unavailable',
+      message: err.response?.data?.detail || err.message
+    });
+  }
 });
 
 // Predict for a specific user
@@ -37,28 +31,26 @@ app.get('/api/predict/:userId', async (req, res) => {
     return res.status(400).json({ error: 'Invalid user_id' });
   }
 
-  const features = usersFeatures[userId];
-  if (!features) {
-    return res.status(404).json({
-      error: 'User not found',
-      userId,
-      message: 'Пользователь не найден в датасете'
-    });
-  }
-
   try {
-    const response = await axios.post(`${MODEL_SERVICE_URL}/predict`, {
-      features
-    }, { timeout: 5000 });
+    const response = await axios.get(`${MODEL_SERVICE_URL}/predict/user/${userId}`, {
+      timeout: 5000
+    });
 
     res.json({
       userId,
-      userData: features,
+      userData: response.data.features,
       prediction: response.data.prediction,
       willComplete: response.data.will_complete,
       probability: response.data.probability
     });
   } catch (err) {
+    if (err.response?.status === 404) {
+      return res.status(404).json({
+        error: 'User not found',
+        userId,
+        message: 'Пользователь не найден в датасете'
+      });
+    }
     console.error('Model service error:', err.message);
     res.status(503).json({
       error: 'Model service unavailable',
@@ -67,10 +59,17 @@ app.get('/api/predict/:userId', async (req, res) => {
   }
 });
 
-app.get('/api/health', (req, res) => {
+app.get('/api/health', async (req, res) => {
+  let usersLoaded = false;
+  try {
+    const response = await axios.get(`${MODEL_SERVICE_URL}/health`, { timeout: 2000 });
+    usersLoaded = response.data.users_loaded > 0;
+  } catch (err) {
+    console.error('Model service error:', err.message);
+  }
   res.json({
     status: 'ok',
-    usersLoaded: Object.keys(usersFeatures).length > 0
+    usersLoaded
   });
 });
 
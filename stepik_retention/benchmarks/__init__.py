@@ -0,0 +1,7 @@
+"""
+Stepik Retention - Benchmarks
+Синтетические логи Stepik (synthetic.py) и замеры стадий пайплайна и /predict (run.py).
+
+Usage (из каталога stepik_retention):
+  python -m benchmarks.run --users 100000 --output bench_report.json
+"""
@@ -0,0 +1,187 @@
+"""
+Benchmark of the pipeline stages and the /predict endpoint on synthetic logs.
+Стадии замеряются profiling.stage (время, пиковый RSS, строки); precompute_features -
+это его main() с путями к синтетическим логам. Для /predict -
+пропускную способность и перцентили задержки (FastAPI-приложение в процессе,
+через httpx.ASGITransport, нужен pip install httpx). Отчёт JSON можно сравнивать
+между коммитами (--baseline).
+
+Usage (из каталога stepik_retention):
+  python -m benchmarks.run --users 100000 --output bench_report.json [--baseline old.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import precompute_features
+import profiling
+import train_model
+from benchmarks.synthetic import generate
+from features import FEATURE_COLUMNS
+from model_service.feature_store import feature_version, read_store
+from profiling import stage
+
+MODEL_SERVICE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 'model_service')
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _import_app(feature_store_path):
+    """Import model_service/app.py as a module with the benchmark feature store."""
+    os.environ['FEATURE_STORE_PATH'] = feature_store_path
+    os.environ.setdefault('PREDICTION_CACHE_SIZE', '0')  # мерим модель, а не кэш
+    sys.path.insert(0, MODEL_SERVICE_DIR)
+    import app
+    return app
+
+
+async def load_test(app_module, rows, concurrency):
+    """
+    POST /predict for every row with bounded concurrency; latencies in seconds.
+    Сервис поднимается тем же load_service, что и при старте uvicorn.
+    """
+    import httpx
+
+    await app_module.load_service()
+    if app_module.service_status != 'ready':
+        raise RuntimeError(f"Model service failed to start: {app_module.load_error}")
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def one(row):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post('/predict', json=row)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(row) for row in rows))
+        elapsed = time.perf_counter() - start
+    await app_module.stop_batcher()
+    return np.array(latencies), elapsed
+
+
+def compare(report, baseline):
+    """Print per-stage time ratios against a previous report."""
+    print(f"\nvs baseline {baseline.get('commit')}:")
+    for name, result in report['stages'].items():
+        old = baseline.get('stages', {}).get(name)
+        if old and old.get('seconds'):
+            print(f"  {name}: {result['seconds']:.3f}s vs {old['seconds']:.3f}s "
+                  f"(x{result['seconds'] / old['seconds']:.2f})")
+    old_rps = baseline.get('predict', {}).get('throughput_rps')
+    if old_rps:
+        print(f"  /predict: {report['predict']['throughput_rps']:.1f} rps vs {old_rps:.1f} rps")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Stepik retention pipeline")
+    parser.add_argument('--users', type=int, default=10_000, help="synthetic users (10k..10M)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help="directory for synthetic CSVs (default: temp dir)")
+    parser.add_argument('--requests', type=int, default=2000, help="/predict requests")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--payload', choices=['features', 'values'], default='features',
+                        help="/predict body: named features or positional values")
+    parser.add_argument('--output', default='bench_report.json')
+    parser.add_argument('--baseline', help="previous report to compare against")
+    parser.add_argument('--precompute-args', default='',
+                        help="extra precompute_features.py arguments, e.g. '--workers 4'")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='stepik_bench_')
+    report = {
+        'commit': _git_commit(),
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': {'users': args.users, 'seed': args.seed},
+    }
+
+    profiling.reset()
+    with stage('generate') as record:
+        events_path, submissions_path, rows = generate(args.users, data_dir, args.seed)
+        record['rows_out'] = rows['events'] + rows['submissions']
+    report['scale'].update(rows)
+    n_rows = rows['events'] + rows['submissions']
+
+    train_model.EVENTS_PATH, train_model.SUBMISSIONS_PATH = events_path, submissions_path
+    with stage('load_and_prepare_data', rows_in=n_rows) as record:
+        events_train, submissions_train, users_data = train_model.load_and_prepare_data()
+        record['rows_out'] = len(events_train) + len(submissions_train)
+
+    with stage('compute_features', rows_in=record['rows_out']) as record:
+        X, _ = train_model.compute_features(events_train, submissions_train, users_data)
+        record['rows_out'] = len(X)
+    del events_train, submissions_train, users_data, X
+
+    # Настоящая точка входа precompute_features.py с путями к синтетическим данным
+    feature_store_path = os.path.join(data_dir, 'users_features.bin')
+    precompute_features.EVENTS_PATH = events_path
+    precompute_features.SUBMISSIONS_PATH = submissions_path
+    precompute_features.OUTPUT_PATH = feature_store_path
+    precompute_features.JSON_OUTPUT_PATH = os.path.join(data_dir, 'users_features.json')
+    argv = sys.argv
+    sys.argv = ['precompute_features.py'] + shlex.split(args.precompute_args)
+    try:
+        with stage('precompute_features', rows_in=n_rows) as record:
+            precompute_features.main()
+    finally:
+        sys.argv = argv
+    _, matrix, _, _, _ = read_store(feature_store_path)
+    record['rows_out'] = len(matrix)
+
+    # Внешние стадии - для сравнения с --baseline, вложенные - для детализации
+    report['stages'] = {r['stage']: r for r in profiling.STAGES if r['depth'] == 0}
+    report['substages'] = [r for r in profiling.STAGES if r['depth'] > 0]
+
+    app_module = _import_app(feature_store_path)
+    rng = np.random.default_rng(args.seed)
+    sample = matrix[rng.integers(0, len(matrix), args.requests)]
+    if args.payload == 'features':
+        payloads = [{'features': dict(zip(FEATURE_COLUMNS, map(float, row)))} for row in sample]
+    else:
+        schema_version = feature_version(FEATURE_COLUMNS)
+        payloads = [{'values': list(map(float, row)), 'schema_version': schema_version}
+                    for row in sample]
+    latencies, elapsed = asyncio.run(load_test(app_module, payloads, args.concurrency))
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    report['predict'] = {
+        'requests': args.requests,
+        'payload': args.payload,
+        'concurrency': args.concurrency,
+        'throughput_rps': args.requests / elapsed,
+        'latency_ms': {'p50': p50, 'p90': p90, 'p99': p99, 'max': latencies.max() * 1000},
+    }
+    print(f"/predict: {report['predict']['throughput_rps']:.1f} rps, "
+          f"p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Seeded generator of synthetic event_data_train.csv / submissions_data_train.csv.
+Схема совпадает с исходными логами; распределения по пользователям приближены к
+реальным: много ранних уходов, длинный хвост прохождения курса, паузы между
+сессиями, несколько неверных попыток на практических шагах.
+
+Usage (из каталога stepik_retention):
+  python -m benchmarks.synthetic --users 1000000 --data-dir ../bench_data
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+N_STEPS = 198              # шагов в курсе (passed > 170 - курс пройден)
+PRACTICE_SHARE = 0.3       # доля шагов с заданиями
+START_TS = 1434326400      # 2015-06-15, начало исходных логов
+END_TS = 1526774400        # 2018-05-20, конец исходных логов
+EARLY_DROPOUT_SHARE = 0.45
+USERS_PER_BATCH = 100_000
+
+
+def make_course(rng):
+    """Step ids and practice flags of a synthetic course."""
+    step_ids = np.sort(rng.choice(np.arange(30000, 40000), N_STEPS, replace=False))
+    practice = rng.random(N_STEPS) < PRACTICE_SHARE
+    return step_ids, practice
+
+
+def generate_batch(rng, user_ids, step_ids, practice):
+    """Events and submissions of one batch of users."""
+    n = len(user_ids)
+    # Глубина прохождения: ранние уходы (геометрическое) + длинный хвост (логнормальное)
+    depth = np.where(
+        rng.random(n) < EARLY_DROPOUT_SHARE,
+        rng.geometric(0.25, n),
+        rng.lognormal(3.8, 1.0, n).astype(np.int64) + 1,
+    )
+    depth = np.clip(depth, 1, N_STEPS)
+    start = rng.integers(START_TS, END_TS - 60 * 86400, n)
+    pace = rng.lognormal(np.log(600), 1.0, n)  # средняя пауза между шагами, сек
+
+    # Строка на (пользователь, шаг)
+    total = int(depth.sum())
+    first = np.cumsum(depth) - depth
+    pos = np.arange(total) - np.repeat(first, depth)
+    uid = np.repeat(user_ids, depth)
+    gaps = rng.exponential(np.repeat(pace, depth))
+    breaks = rng.random(total) < 0.08
+    gaps[breaks] += rng.exponential(2 * 86400, int(breaks.sum()))
+    gaps[first] = 0
+    elapsed = np.cumsum(gaps)
+    elapsed -= np.repeat(elapsed[first], depth)
+    ts = np.repeat(start, depth) + elapsed.astype(np.int64)
+    step = step_ids[pos]
+    is_practice = practice[pos]
+    # Последний шаг засчитан с вероятностью 1/2
+    passed = (pos < np.repeat(depth, depth) - 1) | (rng.random(total) < 0.5)
+
+    views = 1 + rng.poisson(0.4, total)
+    view_idx = np.repeat(np.arange(total), views)
+    view_ts = ts[view_idx] + rng.integers(5, 120, len(view_idx))
+    attempt = np.flatnonzero(is_practice)
+    done = np.flatnonzero(passed)
+    events = pd.concat([
+        pd.DataFrame({'step_id': step, 'timestamp': ts, 'action': 'discovered', 'user_id': uid}),
+        pd.DataFrame({'step_id': step[view_idx], 'timestamp': view_ts, 'action': 'viewed',
+                      'user_id': uid[view_idx]}),
+        pd.DataFrame({'step_id': step[attempt], 'timestamp': ts[attempt] + 30,
+                      'action': 'started_attempt', 'user_id': uid[attempt]}),
+        pd.DataFrame({'step_id': step[done], 'timestamp': ts[done] + rng.integers(30, 600, len(done)),
+                      'action': 'passed', 'user_id': uid[done]}),
+    ], ignore_index=True)
+
+    # Сабмиты: несколько неверных попыток, затем верная, если шаг засчитан
+    wrong = rng.geometric(0.55, len(attempt)) - 1
+    correct = passed[attempt].astype(np.int64)
+    n_subs = wrong + correct
+    sub_idx = np.repeat(attempt, n_subs)
+    sub_first = np.cumsum(n_subs) - n_subs
+    sub_pos = np.arange(len(sub_idx)) - np.repeat(sub_first, n_subs)
+    is_correct = sub_pos == np.repeat(wrong, n_subs)
+    sub_ts = ts[sub_idx] + 60 + sub_pos * rng.integers(20, 200, len(sub_idx))
+    submissions = pd.DataFrame({
+        'step_id': step[sub_idx], 'timestamp': sub_ts,
+        'submission_status': np.where(is_correct, 'correct', 'wrong'), 'user_id': uid[sub_idx],
+    })
+    return (events.sort_values('timestamp', kind='stable'),
+            submissions.sort_values('timestamp', kind='stable'))
+
+
+def generate(n_users, data_dir, seed=42):
+    """Write synthetic logs for n_users to data_dir; returns (events_path, submissions_path, rows)."""
+    rng = np.random.default_rng(seed)
+    step_ids, practice = make_course(rng)
+    os.makedirs(data_dir, exist_ok=True)
+    events_path = os.path.join(data_dir, 'event_data_train.csv')
+    submissions_path = os.path.join(data_dir, 'submissions_data_train.csv')
+
+    rows = {'events': 0, 'submissions': 0}
+    for batch_start in range(0, n_users, USERS_PER_BATCH):
+        user_ids = np.arange(batch_start + 1, min(batch_start + USERS_PER_BATCH, n_users) + 1)
+        events, submissions = generate_batch(rng, user_ids, step_ids, practice)
+        mode, header = ('w', True) if batch_start == 0 else ('a', False)
+        events.to_csv(events_path, mode=mode, header=header, index=False)
+        submissions.to_csv(submissions_path, mode=mode, header=header, index=False)
+        rows['events'] += len(events)
+        rows['submissions'] += len(submissions)
+    return events_path, submissions_path, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic Stepik logs")
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default='bench_data')
+    args = parser.parse_args()
+
+    events_path, submissions_path, rows = generate(args.users, args.data_dir, args.seed)
+    print(f"{rows['events']} events -> {events_path}")
+    print(f"{rows['submissions']} submissions -> {submissions_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Stepik Retention - Feature engineering
+Общий расчёт признаков для train_model.py и precompute_features.py:
+13 базовых признаков за первые 3 дня активности + 6 полиномиальных.
+Все агрегаты считаются за один проход по отсортированным по user_id данным.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model_service.interactions import compile_interactions, compute_interactions
+from profiling import stage
+
+BASE_FEATURES = [
+    'days', 'steps_tried', 'correct', 'wrong', 'correct_ratio', 'viewed', 'passed',
+    'view_to_pass_ratio', 'first_try_ratio', 'active_hours', 'last_sub_correct',
+    'attempts_per_step', 'first_day_ratio'
+]
+# Отобранные полиномиальные признаки (XGB Best ROC-AUC)
+SELECTED_POLY = [
+    'view_to_pass_ratio active_hours', 'days first_try_ratio', 'wrong viewed',
+    'days wrong', 'wrong^2', 'steps_tried viewed'
+]
+FEATURE_COLUMNS = BASE_FEATURES + SELECTED_POLY
+POLY_SPEC = compile_interactions(SELECTED_POLY, BASE_FEATURES)
+# Колонки сырых логов, которые нужны для расчёта признаков
+EVENT_COLUMNS = ['user_id', 'timestamp', 'action']
+SUBMISSION_COLUMNS = ['user_id', 'timestamp', 'step_id', 'submission_status', 'day']
+
+SECONDS_PER_DAY = 24 * 60 * 60
+WINDOW_SEC = 3 * SECONDS_PER_DAY
+DROP_OUT_THRESHOLD = 30 * SECONDS_PER_DAY
+PASSED_COURSE_STEPS = 170
+
+
+def _segments(sorted_ids):
+    """Return unique ids and start offsets of runs in a sorted id array."""
+    if len(sorted_ids) == 0:
+        return sorted_ids, np.empty(0, dtype=np.intp)
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    return sorted_ids[starts], starts
+
+
+def _segment_ends(starts, n):
+    """Last row offset of each run (n - total number of rows)."""
+    return np.r_[starts[1:], n][:len(starts)] - 1
+
+
+def _sum_by(values, starts):
+    """Sum values over the runs given by start offsets."""
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.add.reduceat(np.asarray(values, dtype=np.int64), starts)
+
+
+def _is_sorted(user_ids, timestamps):
+    """Check that rows are ordered by (user_id, timestamp)."""
+    if len(user_ids) < 2:
+        return True
+    du = np.diff(user_ids)
+    return bool(np.all((du > 0) | ((du == 0) & (np.diff(timestamps) >= 0))))
+
+
+def sort_by_user(df):
+    """Stable sort by (user_id, timestamp); skipped if already sorted."""
+    uid = df['user_id'].to_numpy()
+    ts = df['timestamp'].to_numpy()
+    if _is_sorted(uid, ts):
+        return df
+    return df.take(np.lexsort((ts, uid)))
+
+
+def lookup_users(index, user_ids, values, default):
+    """Map user_ids onto values of a sorted user index (default if absent)."""
+    pos = np.searchsorted(index, user_ids)
+    pos = np.minimum(pos, max(len(index) - 1, 0))
+    found = (index[pos] == user_ids) if len(index) else np.zeros(len(user_ids), bool)
+    out = np.full(len(user_ids), default, dtype=np.float64)
+    out[found] = values[pos[found]]
+    return out
+
+
+def user_activity(events):
+    """Per-user min/max timestamp and total passed steps over all events."""
+    events = sort_by_user(events)
+    uids, starts = _segments(events['user_id'].to_numpy())
+    ts = events['timestamp'].to_numpy()
+    ends = _segment_ends(starts, len(ts))
+    passed = _sum_by((events['action'] == 'passed').to_numpy(), starts)
+    return pd.DataFrame({
+        'min_timestamp': ts[starts],
+        'last_timestamp': ts[ends],
+        'passed_total': passed,
+    }, index=pd.Index(uids, name='user_id'))
+
+
+def user_targets(activity):
+    """passed_course / is_gone_user for every user seen in events."""
+    now = activity['last_timestamp'].max()
+    return pd.DataFrame({
+        'passed_course': activity['passed_total'] > PASSED_COURSE_STEPS,
+        'is_gone_user': (now - activity['last_timestamp']) > DROP_OUT_THRESHOLD,
+    }, index=activity.index)
+
+
+def select_training_users(X, users_data):
+    """
+    Training rows: users who are gone or passed the course.
+    Пользователи без сабмитов за первые 3 дня получают нулевые признаки.
+    """
+    users_data = users_data[users_data.is_gone_user | users_data.passed_course]
+    X = X.reindex(users_data.index, fill_value=0)
+    return X, users_data.passed_course.astype(int)
+
+
+def filter_first_days(events, submissions, activity):
+    """Keep events and submissions within the first 3 days after min_timestamp."""
+    index = activity.index.to_numpy()
+    min_ts = activity['min_timestamp'].to_numpy()
+
+    ev_min = lookup_users(index, events['user_id'].to_numpy(), min_ts, np.nan)
+    events_train = events[events['timestamp'].to_numpy() <= ev_min + WINDOW_SEC]
+
+    # Сабмиты пользователей без событий отбрасываются (NaN в min_timestamp)
+    sub_min = lookup_users(index, submissions['user_id'].to_numpy(), min_ts, np.nan)
+    submissions_train = submissions[submissions['timestamp'].to_numpy() <= sub_min + WINDOW_SEC]
+    return events_train, submissions_train
+
+
+def compute_base_features(events_train, submissions_train):
+    """
+    13 базовых признаков для пользователей с сабмитами за первые 3 дня.
+    Возвращает DataFrame с индексом user_id (по возрастанию) и колонками BASE_FEATURES.
+    """
+    with stage('features.submissions', rows_in=len(submissions_train)) as record:
+        subs = submission_counters(submissions_train)
+        record['rows_out'] = len(subs)
+    with stage('features.events', rows_in=len(events_train)) as record:
+        events = event_counters(events_train)
+        record['rows_out'] = len(events)
+    with stage('features.finalize', rows_in=len(subs)):
+        return finalize_base_features(subs, events)
+
+
+def submission_counters(submissions_train):
+    """Per-user submission counters (days, steps_tried, correct, wrong, ...)."""
+    # Submissions: user_id и timestamp по возрастанию (стабильно)
+    submissions_train = sort_by_user(submissions_train)
+    s_uid = submissions_train['user_id'].to_numpy()
+    s_ts = submissions_train['timestamp'].to_numpy()
+    s_step = submissions_train['step_id'].to_numpy()
+    status = submissions_train['submission_status']
+    is_correct = (status == 'correct').to_numpy()
+    is_wrong = (status == 'wrong').to_numpy()
+
+    uids, starts = _segments(s_uid)
+    ends = _segment_ends(starts, len(s_ts))
+    user_change = s_uid[1:] != s_uid[:-1]
+    if 'day' in submissions_train:
+        day = submissions_train['day'].to_numpy()
+    else:
+        day = s_ts // SECONDS_PER_DAY
+    new_day = np.r_[True, user_change | (day[1:] != day[:-1])]
+    # Первая попытка по шагу - самая ранняя
+    first_try = ~pd.DataFrame({'u': s_uid, 's': s_step}).duplicated(keep='first').to_numpy()
+    # Последний сабмит - первая строка с максимальным timestamp (как idxmax)
+    ts_runs = np.flatnonzero(np.r_[True, user_change | (s_ts[1:] != s_ts[:-1])])
+    last_idx = ts_runs[np.searchsorted(ts_runs, ends, side='right') - 1]
+
+    return pd.DataFrame({
+        'days': _sum_by(new_day, starts),
+        'steps_tried': _sum_by(first_try, starts),
+        'correct': _sum_by(is_correct, starts),
+        'wrong': _sum_by(is_wrong, starts),
+        'first_try_correct': _sum_by(first_try & is_correct, starts),
+        'last_sub_correct': is_correct[last_idx],
+    }, index=pd.Index(uids, name='user_id'), dtype=np.float64)
+
+
+def event_counters(events_train):
+    """Per-user event counters (viewed, passed, active_hours, first-day share)."""
+    # Events: user_id и timestamp по возрастанию
+    events_train = sort_by_user(events_train)
+    e_uid = events_train['user_id'].to_numpy()
+    e_ts = events_train['timestamp'].to_numpy()
+    action = events_train['action']
+    e_uids, e_starts = _segments(e_uid)
+    counts = np.diff(np.r_[e_starts, len(e_ts)])
+    first_ts = e_ts[e_starts]
+    last_ts = e_ts[e_starts + counts - 1]
+
+    return pd.DataFrame({
+        'viewed': _sum_by((action == 'viewed').to_numpy(), e_starts),
+        'passed': _sum_by((action == 'passed').to_numpy(), e_starts),
+        'active_hours': (last_ts - first_ts) / 3600,
+        'first_day_events': _sum_by(e_ts < np.repeat(first_ts, counts) + SECONDS_PER_DAY, e_starts),
+        'total_events': counts,
+    }, index=pd.Index(e_uids, name='user_id'), dtype=np.float64)
+
+
+def finalize_base_features(subs, events):
+    """
+    Derive BASE_FEATURES from per-user submission and event counters.
+    Rows are the users present in subs; missing event counters are zero.
+    """
+    events = events.reindex(subs.index)
+    events['total_events'] = events['total_events'].fillna(1)
+    X = subs.join(events.fillna(0))
+    X['correct_ratio'] = X['correct'] / (X['correct'] + X['wrong'] + 1e-10)
+    X['view_to_pass_ratio'] = X['passed'] / (X['viewed'] + 1)
+    X['first_try_ratio'] = X['first_try_correct'] / (X['steps_tried'] + 1)
+    X['attempts_per_step'] = (X['correct'] + X['wrong']) / (X['steps_tried'] + 1)
+    X['first_day_ratio'] = X['first_day_events'] / X['total_events']
+    return X[BASE_FEATURES]
+
+
+def add_poly_features(X):
+    """Добавляет 6 отобранных полиномиальных признаков (как в notebook) по POLY_SPEC."""
+    with stage('poly', rows_in=len(X)):
+        poly = compute_interactions(X[BASE_FEATURES].to_numpy(dtype=np.float64), POLY_SPEC)
+        return pd.concat(
+            [X[BASE_FEATURES], pd.DataFrame(poly, columns=SELECTED_POLY, index=X.index)], axis=1
+        )
+
+
+def build_features(events, submissions):
+    """
+    Полный расчёт: события и сабмиты -> (X с 19 признаками, activity).
+    X индексирован по user_id, activity - по всем пользователям из events.
+    """
+    with stage('window_filter', rows_in=len(events) + len(submissions)) as record:
+        events = sort_by_user(events)
+        activity = user_activity(events)
+        events_train, submissions_train = filter_first_days(events, submissions, activity)
+        record['rows_out'] = len(events_train) + len(submissions_train)
+    X = compute_base_features(events_train, submissions_train)
+    return add_poly_features(X), activity
+
+
+def shard_by_user(df, n_shards):
+    """Hash-partition rows by user_id into n_shards frames."""
+    shard = df['user_id'].to_numpy() % n_shards
+    return [df[shard == i] for i in range(n_shards)]
+
+
+def _build_shard(args):
+    events, submissions, poly = args
+    X, activity = build_features(events, submissions)
+    return (X if poly else X[BASE_FEATURES]), activity
+
+
+def build_features_parallel(events, submissions, workers, poly=True):
+    """
+    build_features по шардам user_id в пуле процессов; результат совпадает с
+    последовательным расчётом (все признаки - агрегаты по одному пользователю).
+    poly=False - только 13 базовых признаков.
+    """
+    shards = zip(shard_by_user(events, workers), shard_by_user(submissions, workers),
+                 [poly] * workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_build_shard, shards))
+    X = pd.concat([r[0] for r in results]).sort_index()
+    activity = pd.concat([r[1] for r in results]).sort_index()
+    return X, activity
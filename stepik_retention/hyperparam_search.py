@@ -0,0 +1,130 @@
+"""
+Stepik Retention - Hyperparameter search
+Поиск XGB_PARAMS для train_model.py: случайные конфигурации, стратифицированная
+кросс-валидация с early stopping (фолды обучаются параллельно) и successive
+halving по числу деревьев - слабые конфигурации отсеиваются на малом бюджете.
+DMatrix и разбиения на фолды строятся один раз и переиспользуются.
+
+Usage: python stepik_retention/train_model.py search [--configs 27] [--folds 5]
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.model_selection import StratifiedKFold
+
+# Пространство поиска (как в notebook)
+PARAM_GRID = {
+    'max_depth': [3, 4, 5, 6],
+    'learning_rate': [0.01, 0.03, 0.05, 0.1],
+    'subsample': [0.7, 0.8, 0.9, 1.0],
+    'colsample_bytree': [0.7, 0.8, 0.9, 1.0],
+    'min_child_weight': [1, 3, 5],
+    'gamma': [0, 0.1, 0.5],
+    'reg_alpha': [0, 0.1, 1],
+    'reg_lambda': [1, 2, 5],
+}
+EARLY_STOPPING_ROUNDS = 50
+
+
+def sample_configs(n_configs, seed=42):
+    """Distinct random configurations from PARAM_GRID."""
+    rng = np.random.default_rng(seed)
+    configs, seen = [], set()
+    max_configs = int(np.prod([len(v) for v in PARAM_GRID.values()]))
+    while len(configs) < min(n_configs, max_configs):
+        config = {k: v[rng.integers(len(v))] for k, v in PARAM_GRID.items()}
+        key = tuple(config.values())
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+class CVData:
+    """DMatrix of the whole training set and its stratified fold slices, built once."""
+
+    def __init__(self, X, y, n_folds=5, seed=42):
+        y = np.asarray(y)
+        self.dtrain = xgb.DMatrix(X, label=y)
+        self.scale_pos_weight = float((y == 0).sum()) / max(int((y == 1).sum()), 1)
+        skf = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+        self.folds = [
+            (self.dtrain.slice(train_idx), self.dtrain.slice(valid_idx))
+            for train_idx, valid_idx in skf.split(np.zeros(len(y)), y)
+        ]
+
+
+def _train_fold(params, num_boost_round, fold):
+    dtrain, dvalid = fold
+    booster = xgb.train(
+        params, dtrain, num_boost_round=num_boost_round, evals=[(dvalid, 'valid')],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False
+    )
+    return booster.best_score, booster.best_iteration + 1
+
+
+def evaluate(config, cv, num_boost_round, executor, threads_per_fold):
+    """Mean/std validation ROC-AUC over folds (trained in parallel) and mean best n_estimators."""
+    params = dict(config, objective='binary:logistic', eval_metric='auc', seed=42,
+                  scale_pos_weight=cv.scale_pos_weight, nthread=threads_per_fold)
+    results = list(executor.map(lambda fold: _train_fold(params, num_boost_round, fold), cv.folds))
+    scores = np.array([r[0] for r in results])
+    rounds = np.array([r[1] for r in results])
+    return scores.mean(), scores.std(), int(round(rounds.mean()))
+
+
+def successive_halving(X, y, n_configs=27, n_folds=5, eta=3, min_rounds=100, max_rounds=900,
+                       n_jobs=None):
+    """
+    Evaluate n_configs on min_rounds trees, keep the best 1/eta, multiply the budget
+    by eta and repeat until max_rounds or one configuration is left.
+    Returns the results table (one row per configuration and rung) and the best XGB_PARAMS.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    cv = CVData(X, y, n_folds)
+    threads_per_fold = max(1, n_jobs // n_folds)
+    configs = list(enumerate(sample_configs(n_configs)))
+    config_by_id = dict(configs)
+    rows = []
+    budget, rung = min_rounds, 0
+
+    with ThreadPoolExecutor(max_workers=min(n_folds, n_jobs)) as executor:
+        while True:
+            rung_rows = []
+            for config_id, config in configs:
+                mean, std, n_estimators = evaluate(config, cv, budget, executor, threads_per_fold)
+                rung_rows.append({'config_id': config_id, 'rung': rung, 'budget': budget,
+                                  'cv_roc_auc': mean, 'cv_roc_auc_std': std,
+                                  'n_estimators': n_estimators, **config})
+                print(f"rung {rung} budget {budget} config {config_id}: ROC-AUC {mean:.4f} ± {std:.4f}")
+            rows.extend(rung_rows)
+            if len(configs) <= 1 or budget >= max_rounds:
+                break
+            ranked = sorted(rung_rows, key=lambda r: r['cv_roc_auc'], reverse=True)
+            keep = {r['config_id'] for r in ranked[:max(1, len(configs) // eta)]}
+            configs = [(i, c) for i, c in configs if i in keep]
+            budget, rung = min(budget * eta, max_rounds), rung + 1
+
+    results = pd.DataFrame(rows).sort_values(['rung', 'cv_roc_auc'], ascending=[False, False])
+    best = results.iloc[0]
+    # Параметры - из исходной конфигурации: строка DataFrame приводит int к float64
+    best_params = {k: v.item() if hasattr(v, 'item') else v
+                   for k, v in config_by_id[int(best['config_id'])].items()}
+    best_params['n_estimators'] = int(best['n_estimators'])
+    return results, best_params
+
+
+def save_results(results, best_params, output_dir):
+    """Write search_results.csv and best_xgb_params.json (loadable by train_model.py --params)."""
+    os.makedirs(output_dir, exist_ok=True)
+    results_path = os.path.join(output_dir, 'search_results.csv')
+    params_path = os.path.join(output_dir, 'best_xgb_params.json')
+    results.to_csv(results_path, index=False)
+    with open(params_path, 'w', encoding='utf-8') as f:
+        json.dump(best_params, f, indent=2)
+    return results_path, params_path
+
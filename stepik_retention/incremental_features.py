@@ -0,0 +1,94 @@
+"""
+Incremental feature update from an appended batch of events/submissions.
+Признаки зависят только от первых 3 дней после min_timestamp пользователя,
+поэтому пересчитываются только пользователи с открытым окном, которых
+затронул батч. Результат - дельта изменённых строк (JSON), с --apply она
+вливается в users_features.bin.
+
+Состояние (накопители по пользователям) хранится в features_state.pkl.
+Первый запуск без состояния по полным CSV строит его с нуля.
+Батчи должны приходить в порядке времени.
+
+Usage:
+  python stepik_retention/incremental_features.py --events batch_events.csv \\
+      --submissions batch_submissions.csv [--apply]
+"""
+import argparse
+import os
+
+import joblib
+
+from features import add_poly_features
+from precompute_features import OUTPUT_PATH, save_feature_store, save_features_json, score_features
+from streaming import (
+    DEFAULT_CHUNKSIZE, EVENTS_DTYPES, SUBMISSIONS_DTYPES, FeatureAccumulator, read_chunks
+)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_PATH = os.path.join(BASE_DIR, 'features_state.pkl')
+DELTA_PATH = os.path.join(BASE_DIR, 'users_features_delta.json')
+
+
+def load_state(path):
+    """Saved accumulator, or an empty one on the first run."""
+    if not os.path.exists(path):
+        print(f"No state at {path}, starting from scratch")
+        return FeatureAccumulator()
+    return joblib.load(path)
+
+
+def apply_batch(acc, events_path, submissions_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Update the accumulator with a batch and return 19 features of changed users.
+    После обновления состояние пользователей с закрытым окном отбрасывается.
+    """
+    acc.track_touched = True
+    acc.reset_touched()
+    # Сначала min_timestamp новых пользователей, затем строки в их окне
+    for chunk in read_chunks(events_path, EVENTS_DTYPES, chunksize):
+        acc.add_activity(chunk)
+    if acc.activity is None:
+        raise ValueError(f"No events in {events_path} and no saved state")
+    for chunk in read_chunks(events_path, EVENTS_DTYPES, chunksize):
+        acc.add_events(chunk)
+    for chunk in read_chunks(submissions_path, SUBMISSIONS_DTYPES, chunksize):
+        acc.add_submissions(chunk)
+
+    delta = add_poly_features(acc.base_features(users=acc.touched_users()))
+    acc.prune(now=acc.activity['last_timestamp'].max())
+    acc.track_touched = False
+    acc.reset_touched()
+    return delta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental user feature update")
+    parser.add_argument('--events', required=True, help="CSV with new events")
+    parser.add_argument('--submissions', required=True, help="CSV with new submissions")
+    parser.add_argument('--state', default=STATE_PATH, help="accumulator state file")
+    parser.add_argument('--delta', default=DELTA_PATH, help="output JSON with changed rows")
+    parser.add_argument('--apply', action='store_true',
+                        help=f"also merge the delta into {os.path.basename(OUTPUT_PATH)}")
+    parser.add_argument('--score', action='store_true',
+                        help="with --apply, score the delta with the CURRENT registry model")
+    parser.add_argument('--model-version', help="score with this registry version instead of CURRENT")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    acc = load_state(args.state)
+    delta = apply_batch(acc, args.events, args.submissions, args.chunksize)
+
+    n_changed = save_features_json(delta, args.delta)
+    print(f"Changed features for {n_changed} users, saved to {args.delta}")
+    if args.apply:
+        scores = score_features(delta, args.model_version) if args.score else None
+        n_users = save_feature_store(delta, OUTPUT_PATH, update=True, scores=scores)
+        print(f"Updated {OUTPUT_PATH} ({n_users} users)")
+
+    # Состояние сохраняется последним: при сбое батч можно повторить
+    joblib.dump(acc, args.state)
+    print(f"State saved to {args.state}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Stepik Retention - Columnar cache of raw logs
+Одноразовая конвертация event_data_train.csv / submissions_data_train.csv в Parquet:
+строки отсортированы по (user_id, timestamp), разбиты на файлы по диапазонам user_id,
+добавлен индекс дня day = timestamp // 86400.
+Скрипты читают кэш, если он новее исходного CSV, иначе - сам CSV.
+
+Usage: python stepik_retention/log_cache.py [--partitions 16] [--chunksize 1000000]
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # кэш необязателен: без pyarrow читаем CSV
+    pa = pq = None
+
+from features import SECONDS_PER_DAY, sort_by_user
+from streaming import DEFAULT_CHUNKSIZE, EVENTS_DTYPES, SUBMISSIONS_DTYPES, read_chunks
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVENTS_PATH = os.path.join(BASE_DIR, 'event_data_train.csv')
+SUBMISSIONS_PATH = os.path.join(BASE_DIR, 'submissions_data_train.csv')
+CACHE_DIR_NAME = 'log_cache'  # рядом с исходным CSV
+META_FILE = '_meta.json'
+DEFAULT_PARTITIONS = 16
+
+
+def cache_dir_for(csv_path, cache_dir=None):
+    """Cache directory of a source CSV, e.g. <csv dir>/log_cache/event_data_train."""
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(csv_path)), CACHE_DIR_NAME)
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, name)
+
+
+def read_meta(csv_path, cache_dir=None):
+    """Cache metadata, or None if the cache is missing or older than the CSV."""
+    meta_path = os.path.join(cache_dir_for(csv_path, cache_dir), META_FILE)
+    if pq is None or not os.path.exists(meta_path):
+        return None
+    if os.path.exists(csv_path) and os.path.getmtime(meta_path) <= os.path.getmtime(csv_path):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _user_row_counts(csv_path, chunksize):
+    """Rows per user_id over the whole CSV (memory bounded by the number of users)."""
+    counts = None
+    for chunk in read_chunks(csv_path, {'user_id': 'int32'}, chunksize):
+        part = chunk['user_id'].value_counts()
+        counts = part if counts is None else counts.add(part, fill_value=0)
+    if counts is None:
+        return pd.Series(dtype=np.int64)
+    return counts.sort_index().astype(np.int64)
+
+
+def _partition_starts(counts, partitions):
+    """First user_id of partitions 1..n-1: ~equal row counts, a user never spans two files."""
+    if counts.empty:
+        return np.empty(0, dtype=np.int64)
+    cum = counts.to_numpy().cumsum()
+    targets = np.linspace(0, cum[-1], partitions + 1)[1:-1]
+    idx = np.unique(np.searchsorted(cum, targets, side='right'))
+    idx = idx[(idx > 0) & (idx < len(cum))]
+    return counts.index.to_numpy()[idx].astype(np.int64)
+
+
+def convert_csv(csv_path, dtypes, cache_dir=None, partitions=DEFAULT_PARTITIONS,
+                chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Convert one CSV into a sorted, user-range partitioned Parquet directory.
+    CSV читается чанками: проход 1 - число строк по user_id (границы диапазонов),
+    проход 2 - строки раскладываются по промежуточным файлам диапазонов, затем каждый
+    диапазон сортируется отдельно. Пиковая память - один диапазон, а не весь лог.
+    """
+    if pq is None:
+        raise ImportError("pyarrow is required to build the log cache: pip install pyarrow")
+
+    starts = _partition_starts(_user_row_counts(csv_path, chunksize), partitions)
+    n_parts = len(starts) + 1
+
+    out_dir = cache_dir_for(csv_path, cache_dir)
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    staging_dir = os.path.join(tmp_dir, '_staging')
+    os.makedirs(staging_dir)
+
+    writers = [None] * n_parts
+    schema = None
+    columns = None
+    for chunk in read_chunks(csv_path, dtypes, chunksize):
+        chunk['day'] = (chunk['timestamp'] // SECONDS_PER_DAY).astype('int32')
+        if schema is None:
+            columns = list(chunk.columns)
+            schema = pa.Table.from_pandas(chunk.iloc[:0], preserve_index=False).schema
+        part_idx = np.searchsorted(starts, chunk['user_id'].to_numpy(), side='right')
+        for i in np.unique(part_idx):
+            if writers[i] is None:
+                writers[i] = pq.ParquetWriter(os.path.join(staging_dir, f'{i:05d}.parquet'), schema)
+            table = pa.Table.from_pandas(chunk[part_idx == i], schema=schema, preserve_index=False)
+            writers[i].write_table(table)
+    for writer in writers:
+        if writer is not None:
+            writer.close()
+
+    parts = []
+    total_rows = 0
+    for i, writer in enumerate(writers):
+        if writer is None:
+            continue
+        staging_path = os.path.join(staging_dir, f'{i:05d}.parquet')
+        df = sort_by_user(pq.read_table(staging_path).to_pandas())
+        file_name = f'part-{len(parts):05d}.parquet'
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False),
+                       os.path.join(tmp_dir, file_name))
+        os.remove(staging_path)
+        parts.append({'file': file_name, 'rows': len(df)})
+        total_rows += len(df)
+        del df
+    shutil.rmtree(staging_dir)
+
+    # Метаданные пишутся последними: их mtime - признак готового кэша
+    with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'source': os.path.basename(csv_path), 'rows': total_rows,
+                   'columns': columns or list(dtypes) + ['day'], 'parts': parts}, f, indent=2)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return out_dir
+
+
+def load_log(csv_path, dtypes, columns=None, cache_dir=None):
+    """
+    Read a raw log from the Parquet cache when it is fresh, otherwise from the CSV.
+    columns may include 'day'; rows from the cache are sorted by (user_id, timestamp).
+    """
+    meta = read_meta(csv_path, cache_dir)
+    if meta is not None:
+        out_dir = cache_dir_for(csv_path, cache_dir)
+        frames = [pd.read_parquet(os.path.join(out_dir, p['file']), columns=columns)
+                  for p in meta['parts']]
+        return pd.concat(frames, ignore_index=True)
+
+    usecols = [c for c in (columns or dtypes) if c in dtypes]
+    df = pd.read_csv(csv_path, dtype=dtypes, usecols=usecols)
+    if columns is None or 'day' in columns:
+        df['day'] = (df['timestamp'] // SECONDS_PER_DAY).astype('int32')
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Parquet cache of raw logs")
+    parser.add_argument('--partitions', type=int, default=DEFAULT_PARTITIONS,
+                        help="number of user_id range partitions per log")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help="CSV rows per chunk")
+    args = parser.parse_args()
+
+    for csv_path, dtypes in ((EVENTS_PATH, EVENTS_DTYPES), (SUBMISSIONS_PATH, SUBMISSIONS_DTYPES)):
+        print(f"Converting {csv_path}...")
+        out_dir = convert_csv(csv_path, dtypes, partitions=args.partitions,
+                              chunksize=args.chunksize)
+        print(f"Saved to {out_dir}")
+
+
+if __name__ == '__main__':
+    main()
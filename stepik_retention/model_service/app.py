@@ -2,14 +2,35 @@
 Stepik Retention Model - Inference API
 Загружает лучшую XGBoost модель (XGB Best ROC-AUC) из notebook.
 Использует 19 признаков: 13 базовых + 6 полиномиальных.
+Метрики запросов и инференса - GET /metrics (формат Prometheus).
+Модель и признаки грузятся в фоне при старте; /health отвечает 503 со
+status=loading, пока загрузка и прогрев модели не закончены.
+Новые версии из models/registry (model_registry.py) загружаются в фоне,
+проверяются на канареечном батче и подменяют модель без рестарта.
+Признаки принимаются словарём, массивом по версии схемы (GET /schema) или
+бинарной матрицей float32 (POST /predict/batch/binary).
 """
+import asyncio
 import os
-import joblib
-from fastapi import FastAPI, HTTPException
+import time
+from collections import namedtuple
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 import numpy as np
 
-app = FastAPI(title="Stepik Retention Model API")
+from batcher import MicroBatcher, QueueFullError
+from booster_model import BOOSTER_PATH, BoosterModel
+import model_registry
+from feature_store import FeatureStore, feature_version
+from interactions import compile_interactions, compute_interactions
+import metrics
+from prediction_cache import PredictionCache, file_hash, row_key, user_key
+from tree_model import PARITY_TOLERANCE, TREES_PATH, TreeEnsemble
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), 'models')
 # Порядок признаков как в X_train_final (base + selected_poly)
@@ -23,51 +44,601 @@ SELECTED_POLY_FEATURES = [
     'days wrong', 'wrong^2', 'steps_tried viewed'
 ]
 FEATURE_COLUMNS = BASE_FEATURES + SELECTED_POLY_FEATURES
+POLY_SPEC = compile_interactions(SELECTED_POLY_FEATURES, BASE_FEATURES)
+# Версии схем позиционного формата: 13 базовых (полиномиальные считаются) или все 19
+SCHEMAS = {feature_version(BASE_FEATURES): BASE_FEATURES,
+           feature_version(FEATURE_COLUMNS): FEATURE_COLUMNS}
+BINARY_CONTENT_TYPE = 'application/octet-stream'
+# xgboost - нативный бустер model.ubj (или model.pkl, если его нет);
+# trees - экспорт деревьев в NumPy (tree_model.py), без xgboost; только для задержки
+# одиночных строк - большие /predict/batch на нём в разы медленнее бустера
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'xgboost')
+FEATURE_STORE_PATH = os.environ.get(
+    'FEATURE_STORE_PATH', os.path.join(MODEL_DIR, 'users_features.bin')
+)
+# Micro-batching одиночных /predict: окно ожидания, размер батча и глубина очереди
+MICROBATCH_ENABLED = os.environ.get('MICROBATCH_ENABLED', '0') == '1'
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get('MICROBATCH_MAX_WAIT_MS', '2'))
+MICROBATCH_MAX_ROWS = int(os.environ.get('MICROBATCH_MAX_ROWS', '64'))
+MICROBATCH_MAX_QUEUE = int(os.environ.get('MICROBATCH_MAX_QUEUE', '1024'))
+# LRU-кэш вероятностей (0 - выключен)
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', '100000'))
+# Батчи крупнее идут в модель мимо кэша: поштучные ключи и get/put дороже инференса,
+# а большой батч вытеснил бы из LRU строки одиночных /predict
+CACHE_MAX_BATCH_ROWS = int(os.environ.get('CACHE_MAX_BATCH_ROWS', '64'))
+# Строк в прогревочном батче (первые строки feature store или нули)
+WARMUP_ROWS = int(os.environ.get('WARMUP_ROWS', '256'))
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', model_registry.REGISTRY_DIR)
+# Период проверки registry/CURRENT в секундах (0 - только POST /admin/reload)
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', '0'))
+# Токен админских эндпоинтов (заголовок X-Admin-Token); пустой - эндпоинты выключены
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
 
-model = None
+# Модель, её версия и metadata.json подменяются одним присваиванием:
+# запрос, начатый на старой версии, дорабатывает на ней
+ActiveModel = namedtuple('ActiveModel', ['model', 'version', 'metadata'])
+active = None
+reload_state = {"status": "idle", "version": None, "error": None}
+reload_lock = asyncio.Lock()
+feature_store = None
+batcher = None
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE)
+# loading -> ready | failed
+service_status = 'loading'
+load_error = None
+model_failed_at_startup = False  # failed из-за модели: рабочая версия из registry вернёт ready
 
 
-def load_model():
-    global model
-    model_path = os.path.join(MODEL_DIR, 'model.pkl')
+def load_model(model_dir=MODEL_DIR):
+    """Load the MODEL_BACKEND artifact of a model directory as an ActiveModel."""
+    if MODEL_BACKEND not in ('xgboost', 'trees'):
+        raise ValueError(f"Unknown MODEL_BACKEND: {MODEL_BACKEND}")
+    booster_path = os.path.join(model_dir, os.path.basename(BOOSTER_PATH))
+    if MODEL_BACKEND == 'trees':
+        model_path, loader = os.path.join(model_dir, os.path.basename(TREES_PATH)), TreeEnsemble.load
+    elif os.path.exists(booster_path):
+        model_path, loader = booster_path, BoosterModel.load
+    else:
+        # Артефакты до model.ubj: XGBClassifier через joblib
+        import joblib
+        model_path, loader = os.path.join(model_dir, 'model.pkl'), joblib.load
     if not os.path.exists(model_path):
         raise FileNotFoundError(
             f"Model not found. Run train_model.py first. Expected: {model_path}"
         )
-    model = joblib.load(model_path)
+    loaded = loader(model_path)
+    metadata_path = os.path.join(model_dir, model_registry.METADATA_FILE)
+    metadata = {}
+    if os.path.exists(metadata_path):
+        metadata = model_registry.read_metadata(os.path.basename(model_dir),
+                                                os.path.dirname(model_dir))
+    # Версия модели - хэш model.pkl (экспорты хранят хэш своего источника)
+    version = getattr(loaded, 'source_version', '') or file_hash(model_path)
+    return ActiveModel(loaded, version, metadata)
+
+
+def warm_up(candidate):
+    """Score one row and a WARMUP_ROWS batch so the first requests do not pay for it."""
+    if feature_store is not None and len(feature_store):
+        X = np.asarray(feature_store.matrix[:WARMUP_ROWS], dtype=np.float32)
+        feature_store.positions(feature_store.user_ids[:1])  # подгрузить индекс user_id
+    else:
+        X = np.zeros((WARMUP_ROWS, len(FEATURE_COLUMNS)), dtype=np.float32)
+    candidate.model.predict_proba(X[:1])
+    probas = candidate.model.predict_proba(X)[:, 1]
+    features_to_matrix([dict(zip(BASE_FEATURES, X[0].tolist()))])
+    return probas
+
+
+def validate(candidate, model_dir):
+    """
+    Canary checks before a model is published: feature columns from metadata,
+    probabilities in [0, 1] on the warm-up batch and parity with canary.npz
+    saved by train_model.py. Raises ValueError.
+    """
+    columns = candidate.metadata.get('feature_columns')
+    if columns is not None and columns != FEATURE_COLUMNS:
+        raise ValueError(f"Model {candidate.version} expects other feature columns")
+    probas = warm_up(candidate)
+    if not np.all((probas >= 0) & (probas <= 1)):
+        raise ValueError(f"Model {candidate.version} returned probabilities outside [0, 1]")
+    canary_path = os.path.join(model_dir, model_registry.CANARY_FILE)
+    if os.path.exists(canary_path):
+        with np.load(canary_path) as canary:
+            actual = candidate.model.predict_proba(canary['X'])[:, 1]
+            diff = float(np.max(np.abs(actual - canary['proba']))) if len(actual) else 0.0
+        if diff > PARITY_TOLERANCE:
+            raise ValueError(f"Model {candidate.version} canary mismatch: max |diff| = {diff:.2e}")
+
+
+def prepare_model(version):
+    """Load and validate a registry version (None - legacy files in MODEL_DIR)."""
+    model_dir = MODEL_DIR if version is None else model_registry.version_dir(version, MODEL_REGISTRY_DIR)
+    start = time.perf_counter()
+    candidate = load_model(model_dir)
+    validate(candidate, model_dir)
+    print(f"Model {candidate.version} ({type(candidate.model).__name__}) loaded and validated "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return candidate
+
+
+def activate(candidate):
+    """Atomic swap: new requests use candidate, the cache starts over for its version."""
+    global active
+    active = candidate
+    prediction_cache.reset(candidate.version)
+
+
+def load_feature_store():
+    """Memory-map precomputed features (precompute_features.py), if present."""
+    global feature_store
+    if not os.path.exists(FEATURE_STORE_PATH):
+        print(f"Feature store not found: {FEATURE_STORE_PATH}. Run precompute_features.py.")
+        return
+    store = FeatureStore(FEATURE_STORE_PATH)
+    if store.feature_columns != FEATURE_COLUMNS:
+        raise ValueError(f"Feature store columns do not match FEATURE_COLUMNS: {FEATURE_STORE_PATH}")
+    feature_store = store
+
 
+async def reload_model():
+    """Load registry/CURRENT in the background and swap it in if it passes validation."""
+    async with reload_lock:
+        version = model_registry.current_version(MODEL_REGISTRY_DIR)
+        if version is None or (active is not None and version == active.version):
+            return
+        reload_state.update(status="loading", version=version, error=None)
+        try:
+            candidate = await run_in_threadpool(prepare_model, version)
+        except Exception as e:
+            reload_state.update(status="failed", error=f"{type(e).__name__}: {e}")
+            print(f"Model {version} rejected, keeping {active.version if active else None}: "
+                  f"{reload_state['error']}")
+            return
+        activate(candidate)
+        reload_state.update(status="ready")
+        print(f"Model {candidate.version} is now active")
+        if service_status == 'failed' and model_failed_at_startup:
+            await mark_ready()
 
-@app.on_event("startup")
-def startup():
-    load_model()
+
+async def mark_ready():
+    """Start the micro-batcher and report ready (after startup or recovery from a bad model)."""
+    global service_status, load_error
+    await start_batcher()
+    service_status, load_error = 'ready', None
+
+
+async def watch_registry():
+    """Poll registry/CURRENT; a version that failed validation is not retried until CURRENT changes."""
+    while True:
+        await asyncio.sleep(MODEL_WATCH_INTERVAL)
+        try:
+            version = model_registry.current_version(MODEL_REGISTRY_DIR)
+        except OSError as e:
+            print(f"Cannot read model registry: {e}")
+            continue
+        failed = reload_state["status"] == "failed" and reload_state["version"] == version
+        active_version = active.version if active is not None else None
+        if version is not None and version != active_version and not failed:
+            await reload_model()
+
+
+async def start_batcher():
+    global batcher
+    if MICROBATCH_ENABLED:
+        batcher = MicroBatcher(
+            predict_matrix, max_rows=MICROBATCH_MAX_ROWS,
+            max_wait_ms=MICROBATCH_MAX_WAIT_MS, max_queue=MICROBATCH_MAX_QUEUE
+        )
+        batcher.start()
+
+
+async def stop_batcher():
+    if batcher is not None:
+        await batcher.stop()
+
+
+async def load_service():
+    """
+    Background startup: the server answers /health (loading) meanwhile.
+    Если CURRENT не прошёл проверку, реплика остаётся failed до публикации
+    рабочей версии (watch_registry или POST /admin/reload).
+    """
+    global service_status, load_error, model_failed_at_startup
+    try:
+        await run_in_threadpool(load_feature_store)
+    except Exception as e:
+        load_error = f"{type(e).__name__}: {e}"
+        service_status = 'failed'
+        print(f"Model service failed to start: {load_error}")
+        return
+    version = model_registry.current_version(MODEL_REGISTRY_DIR)
+    try:
+        candidate = await run_in_threadpool(prepare_model, version)
+    except Exception as e:
+        load_error = f"{type(e).__name__}: {e}"
+        reload_state.update(status="failed", version=version, error=load_error)
+        model_failed_at_startup = True
+        service_status = 'failed'
+        print(f"Model service failed to start: {load_error}")
+        return
+    activate(candidate)
+    reload_state.update(status="ready", version=candidate.version, error=None)
+    await mark_ready()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    tasks = [asyncio.create_task(load_service())]
+    if MODEL_WATCH_INTERVAL > 0:
+        tasks.append(asyncio.create_task(watch_registry()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await stop_batcher()
+
+
+app = FastAPI(title="Stepik Retention Model API", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500  # необработанное исключение обработчика - ответ 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Шаблон маршрута (/predict/user/{user_id}), а не путь - ограниченное число серий
+        route = getattr(request.scope.get('route'), 'path', 'unmatched')
+        metrics.REQUESTS.inc(route, request.method, status)
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, route)
+
+
+class ReloadRequest(BaseModel):
+    version: Optional[str] = None  # версия из registry; по умолчанию - текущий CURRENT
 
 
 class PredictRequest(BaseModel):
-    features: dict  # 19 признаков: 13 базовых + 6 полиномиальных
+    features: Optional[dict] = None       # 13 базовых признаков (+ 6 полиномиальных, иначе по POLY_SPEC)
+    values: Optional[List[float]] = None  # или значения в порядке схемы schema_version
+    schema_version: Optional[str] = None
 
 
-@app.post("/predict")
-def predict(req: PredictRequest):
-    """Предсказание по лучшей XGBoost модели (19 признаков)."""
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+class BatchPredictRequest(BaseModel):
+    features: Optional[List[dict]] = None       # строки признаков, как в PredictRequest
+    values: Optional[List[List[float]]] = None  # или строки значений по schema_version
+    schema_version: Optional[str] = None
+    user_ids: Optional[List[int]] = None        # или user_id из предрассчитанных признаков
+
+
+def features_to_matrix(rows):
+    """
+    Матрица [n, 19] из словарей признаков. Все базовые признаки обязательны;
+    отсутствующие полиномиальные вычисляются из базовых.
+    """
+    for i, f in enumerate(rows):
+        missing = [k for k in BASE_FEATURES if k not in f]
+        unknown = sorted(set(f).difference(FEATURE_COLUMNS))
+        if missing or unknown:
+            raise ValueError(f"row {i}: missing {missing}, unknown {unknown}")
+    base = np.array([[float(f[k]) for k in BASE_FEATURES] for f in rows],
+                    dtype=np.float64).reshape(-1, len(BASE_FEATURES))
+    given = np.array([[float(f.get(k, np.nan)) for k in SELECTED_POLY_FEATURES] for f in rows],
+                     dtype=np.float64).reshape(-1, len(SELECTED_POLY_FEATURES))
+    poly = np.where(np.isnan(given), compute_interactions(base, POLY_SPEC), given)
+    return np.hstack([base, poly])
+
+
+def values_to_matrix(values, schema_version):
+    """
+    Матрица [n, 19] float32 из строк значений в порядке схемы schema_version.
+    Для полной схемы float32-вход используется без копирования; NaN и inf отклоняются.
+    """
+    columns = SCHEMAS.get(schema_version)
+    if columns is None:
+        raise ValueError(f"unknown schema_version {schema_version!r}, see GET /schema")
+    X = np.asarray(values, dtype=np.float32)
+    if X.size == 0:
+        X = X.reshape(0, len(columns))
+    if X.ndim != 2 or X.shape[1] != len(columns):
+        raise ValueError(f"expected rows of {len(columns)} values for schema {schema_version}")
+    # NaN модель приняла бы за пропуск, inf - за значение за всеми порогами
+    finite = np.isfinite(X).all(axis=1)
+    if not finite.all():
+        raise ValueError(f"row {int(np.argmin(finite))}: NaN or infinite value")
+    if columns is BASE_FEATURES:
+        poly = compute_interactions(X.astype(np.float64), POLY_SPEC)
+        X = np.hstack([X, poly.astype(np.float32)])
+    return X
 
+
+def validated_matrix(features=None, values=None, schema_version=None):
+    """Request rows (dicts or positional values) as a [n, 19] matrix; invalid input -> HTTP 400."""
+    if (features is None) == (values is None):
+        raise HTTPException(status_code=400, detail="Pass exactly one of features or values")
+    start = time.perf_counter()
     try:
-        values = [float(req.features.get(k, 0)) for k in FEATURE_COLUMNS]
+        if features is not None:
+            return features_to_matrix(features).astype(np.float32)
+        return values_to_matrix(values, schema_version)
     except (TypeError, ValueError) as e:
         raise HTTPException(status_code=400, detail=f"Invalid features: {e}")
+    finally:
+        metrics.VALIDATION_LATENCY.observe(time.perf_counter() - start)
+
+
+def predict_matrix(X, current=None):
+    """Вероятность класса 1 для матрицы [n, 19] одним вызовом модели (current или active)."""
+    X = np.asarray(X, dtype=np.float32).reshape(-1, len(FEATURE_COLUMNS))
+    current = current or active
+    start = time.perf_counter()
+    probas = current.model.predict_proba(X)[:, 1]
+    metrics.INFERENCE_LATENCY.observe(time.perf_counter() - start)
+    metrics.BATCH_SIZE.observe(len(X))
+    return probas
 
-    X = np.array([values]).reshape(1, -1)
-    pred = int(model.predict(X)[0])
-    proba = float(model.predict_proba(X)[0][1])
 
+def format_prediction(proba):
+    """Метка класса выводится из вероятности (proba > 0.5, как в XGBClassifier.predict)."""
+    pred = proba > 0.5
     return {
         "will_complete": bool(pred),
-        "probability": round(proba, 4),
+        "probability": round(float(proba), 4),
         "prediction": "Пройдёт курс" if pred else "Не пройдёт курс"
     }
 
 
+def predict_cached(keys, X):
+    """Вероятности для строк X с ключами кэша keys; промахи считаются одним вызовом модели."""
+    current = active
+    probas = np.array([prediction_cache.get(k) for k in keys], dtype=np.float64)
+    miss = np.isnan(probas)
+    if miss.any():
+        probas[miss] = predict_matrix(X if miss.all() else np.asarray(X)[miss], current)
+        for key, proba in zip((k for k, m in zip(keys, miss) if m), probas[miss]):
+            prediction_cache.put(key, proba, current.version)
+    return probas
+
+
+def predict_rows(X, make_keys):
+    """
+    Batch probabilities: up to CACHE_MAX_BATCH_ROWS rows go through the cache
+    (keys from make_keys()), larger batches straight to the model.
+    """
+    if len(X) == 0:
+        return np.empty(0)
+    if len(X) > CACHE_MAX_BATCH_ROWS:
+        return predict_matrix(X)
+    return predict_cached(make_keys(), X)
+
+
+def stored_probas(pos):
+    """Вероятности из feature store, если они посчитаны текущей моделью, иначе None."""
+    if (active is None or feature_store.probas is None
+            or feature_store.score_model_version != active.version):
+        return None
+    return np.asarray(feature_store.probas[pos], dtype=np.float64)
+
+
+def stored_features(user_id):
+    """Row of the feature store for user_id, or HTTP error."""
+    if feature_store is None:
+        raise HTTPException(status_code=503, detail="Feature store not loaded")
+    row = feature_store.get(user_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return row
+
+
+@app.post("/predict")
+async def predict(req: PredictRequest):
+    """Предсказание по лучшей XGBoost модели (19 признаков)."""
+    if active is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+
+    values = validated_matrix(
+        None if req.features is None else [req.features],
+        None if req.values is None else [req.values], req.schema_version
+    )[0]
+    key = row_key(values)
+    current = active
+    proba = prediction_cache.get(key)
+    if proba is None:
+        if batcher is None:
+            proba = (await run_in_threadpool(predict_matrix, values, current))[0]
+        else:
+            try:
+                proba = await batcher.submit(values)
+            except QueueFullError as e:
+                raise HTTPException(status_code=503, detail=str(e))
+        prediction_cache.put(key, proba, current.version)
+    return format_prediction(proba)
+
+
+@app.post("/predict/batch")
+def predict_batch(req: BatchPredictRequest):
+    """Пакетное предсказание: все строки оцениваются одним вызовом predict_proba."""
+    if active is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if sum(x is not None for x in (req.features, req.values, req.user_ids)) != 1:
+        raise HTTPException(status_code=400,
+                            detail="Pass exactly one of features, values or user_ids")
+
+    if req.user_ids is None:
+        X = validated_matrix(req.features, req.values, req.schema_version)
+        probas = predict_rows(X, lambda: [row_key(row) for row in X])
+        return {"predictions": [format_prediction(p) for p in probas]}
+
+    if feature_store is None:
+        raise HTTPException(status_code=503, detail="Feature store not loaded")
+    # Список, а не int64-массив: id вне int64 просто не находятся
+    pos = feature_store.positions(req.user_ids)
+    found = pos >= 0
+    found_ids = [uid for uid, ok in zip(req.user_ids, found) if ok]
+    probas = stored_probas(pos[found])
+    if probas is None:
+        probas = predict_rows(feature_store.matrix[pos[found]],
+                              lambda: [user_key(uid) for uid in found_ids])
+    return {
+        "predictions": [
+            {"user_id": uid, **format_prediction(p)}
+            for uid, p in zip(found_ids, probas)
+        ],
+        "not_found": [uid for uid, ok in zip(req.user_ids, found) if not ok]
+    }
+
+
+@app.post("/predict/batch/binary")
+async def predict_batch_binary(request: Request, x_schema_version: str = Header(...)):
+    """
+    Тело - матрица float32 little-endian (строки по схеме X-Schema-Version),
+    читается через np.frombuffer без копирования. Ответ - JSON или, при
+    Accept: application/octet-stream, вероятности float32 little-endian.
+    """
+    if active is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if request.headers.get('content-type', '').split(';')[0].strip() != BINARY_CONTENT_TYPE:
+        raise HTTPException(status_code=415, detail=f"Expected Content-Type: {BINARY_CONTENT_TYPE}")
+    columns = SCHEMAS.get(x_schema_version)
+    if columns is None:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown schema version {x_schema_version!r}, see GET /schema")
+    body = await request.body()
+    row_bytes = 4 * len(columns)
+    if len(body) % row_bytes:
+        raise HTTPException(status_code=400,
+                            detail=f"Body length {len(body)} is not a multiple of {row_bytes}")
+    X = validated_matrix(values=np.frombuffer(body, dtype='<f4').reshape(-1, len(columns)),
+                         schema_version=x_schema_version)
+    # Мимо кэша: view из np.frombuffer уходит в модель без копирования
+    probas = await run_in_threadpool(predict_matrix, X) if len(X) else np.empty(0)
+    if BINARY_CONTENT_TYPE in request.headers.get('accept', ''):
+        return Response(np.asarray(probas, dtype='<f4').tobytes(), media_type=BINARY_CONTENT_TYPE)
+    return {"predictions": [format_prediction(p) for p in probas]}
+
+
+@app.get("/schema")
+def schema():
+    """Версии схем позиционного формата и порядок признаков в них."""
+    return {
+        "schemas": [{"schema_version": v, "feature_columns": c} for v, c in SCHEMAS.items()],
+        "default": feature_version(FEATURE_COLUMNS),
+    }
+
+
+@app.get("/users")
+def users():
+    """user_id всех пользователей с предрассчитанными признаками."""
+    if feature_store is None:
+        raise HTTPException(status_code=503, detail="Feature store not loaded")
+    return {"user_ids": feature_store.user_ids.tolist()}
+
+
+@app.get("/features/{user_id}")
+def features(user_id: int):
+    """Предрассчитанные признаки пользователя."""
+    row = stored_features(user_id)
+    return {"user_id": user_id, "features": feature_store.as_dict(row)}
+
+
+@app.get("/predict/user/{user_id}")
+def predict_user(user_id: int):
+    """Предсказание по предрассчитанным признакам пользователя."""
+    if active is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    row = stored_features(user_id)
+    probas = stored_probas(feature_store.positions([user_id]))
+    if probas is None:
+        probas = predict_cached([user_key(user_id)], row.reshape(1, -1))
+    proba = probas[0]
+    return {"user_id": user_id, "features": feature_store.as_dict(row), **format_prediction(proba)}
+
+
 @app.get("/health")
 def health():
-    return {"status": "ok", "model_loaded": model is not None}
+    """status: loading (503) -> ready | failed (503). prediction_cache - статистика этого процесса."""
+    body = {
+        "status": service_status,
+        "error": load_error,
+        "model_loaded": active is not None,
+        "model_version": active.version if active is not None else None,
+        "users_loaded": len(feature_store) if feature_store is not None else 0,
+        "stored_scores_valid": feature_store is not None and stored_probas([]) is not None,
+        "prediction_cache": prediction_cache.stats()
+    }
+    return JSONResponse(body, status_code=200 if service_status == 'ready' else 503)
+
+
+def check_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.get("/admin/model")
+def admin_model(x_admin_token: Optional[str] = Header(None)):
+    """Активная версия, её метаданные, состояние перезагрузки и версии в registry."""
+    check_admin(x_admin_token)
+    return {
+        "active": None if active is None else {"version": active.version, "metadata": active.metadata},
+        "reload": reload_state,
+        "current": model_registry.current_version(MODEL_REGISTRY_DIR),
+        "versions": model_registry.list_versions(MODEL_REGISTRY_DIR),
+    }
+
+
+@app.post("/admin/reload", status_code=202)
+def admin_reload(background_tasks: BackgroundTasks, req: Optional[ReloadRequest] = None,
+                 x_admin_token: Optional[str] = Header(None)):
+    """
+    Переключить CURRENT (если передана version) и загрузить его в фоне.
+    Остальные реплики подхватят CURRENT через MODEL_WATCH_INTERVAL.
+    """
+    check_admin(x_admin_token)
+    if service_status == 'loading':
+        raise HTTPException(status_code=503, detail="Service is loading")
+    if req is not None and req.version:
+        try:
+            model_registry.set_current(req.version, MODEL_REGISTRY_DIR)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    background_tasks.add_task(reload_model)
+    return {"status": "accepted", "current": model_registry.current_version(MODEL_REGISTRY_DIR),
+            "active_version": active.version if active is not None else None}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Счётчики и гистограммы в текстовом формате Prometheus."""
+    cache = prediction_cache.stats()
+    gauges = [
+        '# HELP stepik_model_loaded 1 if the model is loaded',
+        '# TYPE stepik_model_loaded gauge',
+        f'stepik_model_loaded {int(active is not None)}',
+        '# HELP stepik_model_info Active model version',
+        '# TYPE stepik_model_info gauge',
+        f'stepik_model_info{{version="{active.version if active else ""}"}} 1',
+        '# HELP stepik_service_ready 1 after the model is loaded and warmed up',
+        '# TYPE stepik_service_ready gauge',
+        f'stepik_service_ready {int(service_status == "ready")}',
+        '# HELP stepik_prediction_cache_size Entries in the prediction cache',
+        '# TYPE stepik_prediction_cache_size gauge',
+        f'stepik_prediction_cache_size {cache["size"]}',
+        '# HELP stepik_prediction_cache_hits_total Prediction cache hits',
+        '# TYPE stepik_prediction_cache_hits_total counter',
+        f'stepik_prediction_cache_hits_total {cache["hits"]}',
+        '# HELP stepik_prediction_cache_misses_total Prediction cache misses',
+        '# TYPE stepik_prediction_cache_misses_total counter',
+        f'stepik_prediction_cache_misses_total {cache["misses"]}',
+    ]
+    if batcher is not None:
+        gauges += [
+            '# HELP stepik_microbatch_queue_depth Rows waiting in the micro-batcher queue',
+            '# TYPE stepik_microbatch_queue_depth gauge',
+            f'stepik_microbatch_queue_depth {batcher.queue.qsize()}',
+        ]
+    return PlainTextResponse(metrics.render(gauges), media_type='text/plain; version=0.0.4')
@@ -0,0 +1,85 @@
+"""
+Stepik Retention - Micro-batching for /predict
+Собирает одиночные запросы в течение нескольких миллисекунд (или до N строк)
+и оценивает их одним матричным вызовом модели.
+"""
+import asyncio
+
+import numpy as np
+
+
+class QueueFullError(Exception):
+    """Raised when the batcher queue is at MICROBATCH_MAX_QUEUE."""
+
+
+class MicroBatcher:
+    """
+    Async micro-batcher: submit() returns the score of one row; rows queued
+    within max_wait_ms (up to max_rows) are scored together by score_fn.
+    """
+
+    def __init__(self, score_fn, max_rows=64, max_wait_ms=2.0, max_queue=1024):
+        self.score_fn = score_fn
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, row):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((row, future))
+        except asyncio.QueueFull:
+            raise QueueFullError("Prediction queue is full")
+        return await future
+
+    async def _collect(self):
+        """Wait for the first row, then gather more until max_rows or max_wait."""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_rows:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Отменённые клиентом запросы не оцениваем
+            batch = [(row, f) for row, f in batch if not f.done()]
+            if not batch:
+                continue
+            X = np.array([row for row, _ in batch], dtype=np.float32)
+            try:
+                # Модель считается в пуле потоков, чтобы не блокировать event loop
+                scores = await loop.run_in_executor(None, self.score_fn, X)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), score in zip(batch, scores):
+                if not future.done():
+                    future.set_result(score)
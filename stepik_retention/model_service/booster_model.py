@@ -0,0 +1,45 @@
+"""
+Stepik Retention - Native XGBoost booster
+model.ubj - бустер в собственном формате XGBoost (UBJSON): загружается без
+joblib и sklearn-обёртки XGBClassifier, предсказания через inplace_predict
+(без DMatrix). Версия исходной model.pkl хранится в атрибутах бустера.
+"""
+import os
+
+import numpy as np
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+BOOSTER_PATH = os.path.join(MODEL_DIR, 'model.ubj')
+
+
+class BoosterModel:
+    """predict_proba-compatible wrapper around xgboost.Booster (binary:logistic)."""
+
+    def __init__(self, booster):
+        self.booster = booster
+        self.source_version = booster.attr('source_version') or ''
+
+    @classmethod
+    def load(cls, path=BOOSTER_PATH):
+        import xgboost as xgb
+
+        booster = xgb.Booster()
+        booster.load_model(path)
+        return cls(booster)
+
+    def predict_proba(self, X):
+        """[n_rows, 2] class probabilities, like XGBClassifier.predict_proba."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        proba = np.asarray(self.booster.inplace_predict(X), dtype=np.float64)
+        return np.column_stack([1 - proba, proba])
+
+    def predict(self, X):
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(int)
+
+
+def export_booster(model, path=BOOSTER_PATH, source_version=''):
+    """Save the booster of an XGBClassifier in the native format."""
+    booster = model.get_booster()
+    booster.set_attr(source_version=source_version)
+    booster.save_model(path)
+    return BoosterModel(booster)
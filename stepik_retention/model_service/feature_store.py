@@ -0,0 +1,143 @@
+"""
+Stepik Retention - Binary feature store
+Компактная замена users_features.json: отсортированный индекс user_id (int64)
+и матрица признаков float32, читаемые через memory map без парсинга.
+
+Layout (little-endian):
+  magic b'SRFS' | uint32 header_len | JSON header (padded to 64 bytes)
+  user_ids int64[n_users] | features float32[n_users, n_features]
+  [probas float32[n_users]]  - если есть score_model_version (метка - probas > 0.5)
+  В format_version 2 за probas следовал неиспользуемый labels uint8[n_users]; он игнорируется.
+"""
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'SRFS'
+FORMAT_VERSION = 3
+SUPPORTED_VERSIONS = (1, 2, 3)
+ALIGN = 64
+INT64_MIN, INT64_MAX = int(np.iinfo(np.int64).min), int(np.iinfo(np.int64).max)
+
+
+def feature_version(feature_columns):
+    """Short hash of the ordered feature names."""
+    return hashlib.sha1('\n'.join(feature_columns).encode('utf-8')).hexdigest()[:12]
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_store(path, user_ids, matrix, feature_columns, probas=None, score_model_version=None):
+    """
+    Write user_ids and an [n_users, n_features] matrix; rows are sorted by user_id.
+    probas - предрассчитанные вероятности модели score_model_version (необязательно).
+    """
+    user_ids = np.asarray(user_ids, dtype='<i8')
+    matrix = np.asarray(matrix, dtype='<f4')
+    if matrix.shape != (len(user_ids), len(feature_columns)):
+        raise ValueError(f"Matrix shape {matrix.shape} does not match "
+                         f"{len(user_ids)} users x {len(feature_columns)} features")
+    if (probas is None) != (score_model_version is None):
+        raise ValueError("probas and score_model_version must be passed together")
+    order = np.argsort(user_ids, kind='stable')
+    user_ids, matrix = user_ids[order], np.ascontiguousarray(matrix[order])
+    if probas is not None:
+        probas = np.asarray(probas, dtype='<f4')[order]
+    if len(user_ids) > 1 and np.any(user_ids[1:] == user_ids[:-1]):
+        raise ValueError("Duplicate user_id in feature store")
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'feature_version': feature_version(feature_columns),
+        'feature_columns': list(feature_columns),
+        'n_users': int(len(user_ids)),
+        'score_model_version': score_model_version,
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_offset = _align(len(MAGIC) + 4 + len(header_bytes))
+    header_bytes = header_bytes.ljust(data_offset - len(MAGIC) - 4, b' ')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(user_ids.tobytes())
+        f.write(matrix.tobytes())
+        if probas is not None:
+            f.write(probas.tobytes())
+    os.replace(tmp_path, path)
+
+
+class FeatureStore:
+    """Read-only memory-mapped view of a feature store file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a feature store file: {path}")
+            (header_len,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        if header['format_version'] not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported feature store version: {header['format_version']}")
+
+        self.path = path
+        self.feature_columns = header['feature_columns']
+        self.feature_version = header['feature_version']
+        # Версия модели, которой посчитаны probas (None - скоров нет)
+        self.score_model_version = header.get('score_model_version')
+        n_users, n_features = header['n_users'], len(self.feature_columns)
+        offset = len(MAGIC) + 4 + header_len
+        self.probas = None
+        if n_users:
+            self.user_ids = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(n_users,))
+            offset += 8 * n_users
+            self.matrix = np.memmap(path, dtype='<f4', mode='r', offset=offset,
+                                    shape=(n_users, n_features))
+            offset += 4 * n_users * n_features
+            if self.score_model_version is not None:
+                self.probas = np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(n_users,))
+        else:
+            self.user_ids = np.empty(0, dtype='<i8')
+            self.matrix = np.empty((0, n_features), dtype='<f4')
+            if self.score_model_version is not None:
+                self.probas = np.empty(0, dtype='<f4')
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def positions(self, user_ids):
+        """Row positions of user_ids; -1 for unknown users (including ids outside int64)."""
+        try:
+            user_ids = np.asarray(user_ids, dtype=np.int64)
+        except OverflowError:
+            user_ids = list(user_ids)
+            in_range = np.array([INT64_MIN <= u <= INT64_MAX for u in user_ids], dtype=bool)
+            pos = np.full(len(user_ids), -1, dtype=np.int64)
+            pos[in_range] = self.positions([u for u, ok in zip(user_ids, in_range) if ok])
+            return pos
+        pos = np.searchsorted(self.user_ids, user_ids)
+        pos = np.minimum(pos, max(len(self.user_ids) - 1, 0))
+        found = (self.user_ids[pos] == user_ids) if len(self.user_ids) else np.zeros(len(user_ids), bool)
+        return np.where(found, pos, -1)
+
+    def get(self, user_id):
+        """Feature row (float32 view) of a user, or None."""
+        pos = self.positions([user_id])[0]
+        return None if pos < 0 else self.matrix[pos]
+
+    def as_dict(self, row):
+        return {k: float(v) for k, v in zip(self.feature_columns, row)}
+
+
+def read_store(path):
+    """All rows as (user_ids, matrix, feature_columns, probas, score_model_version) in memory."""
+    store = FeatureStore(path)
+    probas = None if store.probas is None else np.array(store.probas)
+    return (np.array(store.user_ids), np.array(store.matrix), store.feature_columns,
+            probas, store.score_model_version)
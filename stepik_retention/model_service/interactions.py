@@ -0,0 +1,35 @@
+"""
+Stepik Retention - Interaction features
+Декларативное описание полиномиальных признаков по именам PolynomialFeatures
+('days wrong' = days * wrong, 'wrong^2' = wrong ** 2): считаются только нужные
+произведения, без полного разложения второй степени.
+"""
+import numpy as np
+
+
+def parse_interaction(name, base_features):
+    """Column indices of the factors: 'days wrong' -> (i_days, i_wrong), 'wrong^2' -> (i_wrong, i_wrong)."""
+    factors = []
+    for token in name.split(' '):
+        feature, _, power = token.partition('^')
+        if feature not in base_features:
+            raise ValueError(f"Unknown feature {feature!r} in interaction {name!r}")
+        factors += [base_features.index(feature)] * (int(power) if power else 1)
+    return tuple(factors)
+
+
+def compile_interactions(names, base_features):
+    """Spec for compute_interactions: one factor tuple per interaction name."""
+    return [parse_interaction(name, list(base_features)) for name in names]
+
+
+def compute_interactions(base, spec):
+    """Interaction columns [n_rows, len(spec)] from a base feature matrix [n_rows, n_base]."""
+    base = np.atleast_2d(np.asarray(base, dtype=np.float64))
+    out = np.empty((len(base), len(spec)), dtype=np.float64)
+    for j, factors in enumerate(spec):
+        col = base[:, factors[0]].copy()
+        for i in factors[1:]:
+            col *= base[:, i]
+        out[:, j] = col
+    return out
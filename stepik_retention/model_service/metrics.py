@@ -0,0 +1,93 @@
+"""
+Stepik Retention - Service metrics
+Счётчики и гистограммы в текстовом формате Prometheus (GET /metrics)
+без внешних зависимостей. Значения живут в памяти одного процесса, поэтому
+сервис запускается с одним воркером uvicorn на реплику (см. Dockerfile).
+"""
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for values, count in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.label_names, values)} {count}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram (le = upper bound, +Inf = count)."""
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(label_values, [0] * (len(self.buckets) + 2))
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _labels(self.label_names + ('le',), values + (bound,))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _labels(self.label_names + ('le',), values + ('+Inf',))
+                lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+                labels = _labels(self.label_names, values)
+                lines.append(f'{self.name}_sum{labels} {series[-2]}')
+                lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+REQUESTS = Counter('stepik_requests_total', 'HTTP requests by route and status code',
+                   labels=('route', 'method', 'status'))
+REQUEST_LATENCY = Histogram('stepik_request_latency_seconds', 'HTTP request latency by route',
+                            LATENCY_BUCKETS, labels=('route',))
+BATCH_SIZE = Histogram('stepik_inference_batch_size', 'Rows per model call', BATCH_SIZE_BUCKETS)
+INFERENCE_LATENCY = Histogram('stepik_inference_latency_seconds', 'Model call latency',
+                              LATENCY_BUCKETS)
+VALIDATION_LATENCY = Histogram('stepik_validation_latency_seconds',
+                               'Request feature validation and matrix assembly latency',
+                               LATENCY_BUCKETS)
+ALL = (REQUESTS, REQUEST_LATENCY, BATCH_SIZE, INFERENCE_LATENCY, VALIDATION_LATENCY)
+
+
+def render(extra_lines=()):
+    """All metrics in Prometheus text exposition format 0.0.4."""
+    lines = []
+    for metric in ALL:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
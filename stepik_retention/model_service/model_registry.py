@@ -0,0 +1,102 @@
+"""
+Stepik Retention - Versioned model registry
+models/registry/<version>/ - артефакты одной обученной модели (model.ubj,
+model_trees.npz, model.pkl, canary.npz) и metadata.json (метрики, параметры,
+признаки). Файл CURRENT содержит активную версию; сервис следит за ним
+и подменяет модель без перезапуска.
+
+Usage: python stepik_retention/model_service/model_registry.py [--activate VERSION]
+(без аргументов - список версий; --activate - откат или переключение)
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+REGISTRY_DIR = os.path.join(MODEL_DIR, 'registry')
+CURRENT_FILE = 'CURRENT'
+METADATA_FILE = 'metadata.json'
+CANARY_FILE = 'canary.npz'
+
+
+def version_dir(version, registry_dir=REGISTRY_DIR):
+    return os.path.join(registry_dir, version)
+
+
+def current_version(registry_dir=REGISTRY_DIR):
+    """Active version from CURRENT, or None if nothing is published."""
+    try:
+        with open(os.path.join(registry_dir, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_metadata(version, registry_dir=REGISTRY_DIR):
+    with open(os.path.join(version_dir(version, registry_dir), METADATA_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    """Metadata of all published versions, newest first."""
+    if not os.path.isdir(registry_dir):
+        return []
+    versions = []
+    for name in os.listdir(registry_dir):
+        if os.path.exists(os.path.join(registry_dir, name, METADATA_FILE)):
+            versions.append(read_metadata(name, registry_dir))
+    return sorted(versions, key=lambda m: m['created_at'], reverse=True)
+
+
+def set_current(version, registry_dir=REGISTRY_DIR):
+    """Point CURRENT at version (atomic rename)."""
+    if not os.path.exists(os.path.join(version_dir(version, registry_dir), METADATA_FILE)):
+        raise FileNotFoundError(f"Model version not found: {version}")
+    tmp_path = os.path.join(registry_dir, CURRENT_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, os.path.join(registry_dir, CURRENT_FILE))
+
+
+def publish(version, artifacts, metadata, registry_dir=REGISTRY_DIR, activate=True):
+    """
+    Copy artifact files into registry/<version>/ with metadata.json and, if
+    activate, make it CURRENT. The directory appears only when complete.
+    """
+    out_dir = version_dir(version, registry_dir)
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for path in artifacts:
+        shutil.copy2(path, os.path.join(tmp_dir, os.path.basename(path)))
+    metadata = dict(metadata, version=version, created_at=metadata.get('created_at', time.time()),
+                    artifacts=sorted(os.path.basename(p) for p in artifacts))
+    with open(os.path.join(tmp_dir, METADATA_FILE), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    if activate:
+        set_current(version, registry_dir)
+    return out_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or activate registered model versions")
+    parser.add_argument('--activate', metavar='VERSION', help="make VERSION the CURRENT model")
+    args = parser.parse_args()
+
+    if args.activate:
+        set_current(args.activate)
+        print(f"CURRENT -> {args.activate}")
+        print("Stored scores of other versions are ignored; re-run precompute_features.py --score")
+    current = current_version()
+    for meta in list_versions():
+        marker = '*' if meta['version'] == current else ' '
+        created = time.strftime('%Y-%m-%d %H:%M', time.localtime(meta['created_at']))
+        print(f"{marker} {meta['version']}  {created}  ROC-AUC {meta.get('roc_auc', float('nan')):.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Stepik Retention - Prediction cache
+LRU-кэш вероятностей по user_id или хэшу вектора признаков. Ключи привязаны
+к версии модели: после загрузки новой model.pkl кэш сбрасывается.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def file_hash(path):
+    """Short sha256 of a file, used as the model version."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+def row_key(values):
+    """Cache key of a feature vector (float32 bytes, as seen by the model)."""
+    data = np.ascontiguousarray(values, dtype=np.float32).tobytes()
+    return 'row', hashlib.blake2b(data, digest_size=16).digest()
+
+
+def user_key(user_id):
+    return 'user', int(user_id)
+
+
+class PredictionCache:
+    """Thread-safe LRU of class-1 probabilities for one model version."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.version = None
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self, version):
+        """Drop all entries and start caching for a new model version."""
+        with self._lock:
+            self._items.clear()
+            self.version = version
+            self.hits = self.misses = 0
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            proba = self._items.get(key)
+            if proba is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return proba
+
+    def put(self, key, proba, version):
+        """Store proba computed by model version; stale versions are ignored."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            self._items[key] = float(proba)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model_version": self.version,
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,189 @@
+"""
+Stepik Retention - Array-based tree ensemble
+Экспорт деревьев XGBoost-бустера в плоские массивы и векторизованный обход
+на NumPy: инференс без xgboost, DMatrix и sklearn-обёртки.
+Бэкенд рассчитан на задержку одиночных строк и небольших батчей: на батчах
+в тысячи строк нативный бустер (booster_model.py) быстрее на порядок.
+
+Usage: python stepik_retention/model_service/tree_model.py
+(экспортирует models/model.pkl в models/model_trees.npz и проверяет совпадение
+с predict_proba; заодно сохраняет нативный бустер models/model.ubj).
+Оба файла не хранятся в git; Dockerfile запускает этот экспорт при сборке.
+"""
+import json
+import os
+
+import numpy as np
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+TREES_PATH = os.path.join(MODEL_DIR, 'model_trees.npz')
+PARITY_TOLERANCE = 1e-5
+# Строк за один обход: временные массивы [rows, n_trees] остаются в кэше процессора
+PREDICT_CHUNK_ROWS = 256
+
+
+class TreeEnsemble:
+    """
+    Binary logistic tree ensemble stored as flat node arrays.
+    Узлы всех деревьев лежат подряд; left/right - глобальные индексы, -1 у листьев.
+    """
+
+    def __init__(self, left, right, feature, threshold, default_left, value,
+                 roots, base_margin, max_depth, feature_names, source_version=''):
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.value = np.asarray(value, dtype=np.float32)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.base_margin = float(base_margin)
+        self.max_depth = int(max_depth)
+        self.feature_names = list(feature_names)
+        # Версия исходной model.pkl: экспорт считается той же моделью
+        self.source_version = str(source_version)
+
+    @classmethod
+    def from_booster(cls, booster):
+        """Export an xgboost.Booster (binary:logistic, numeric splits)."""
+        learner = json.loads(booster.save_raw('json'))['learner']
+        objective = learner['objective']['name']
+        if objective != 'binary:logistic':
+            raise ValueError(f"Unsupported objective: {objective}")
+        base_score = float(learner['learner_model_param']['base_score'])
+        feature_names = learner.get('feature_names') or []
+
+        left, right, feature, threshold, default_left, value, roots = [], [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for tree in learner['gradient_booster']['model']['trees']:
+            if any(tree.get('split_type', [])):
+                raise ValueError("Categorical splits are not supported")
+            tree_left = np.asarray(tree['left_children'])
+            tree_right = np.asarray(tree['right_children'])
+            is_leaf = tree_left < 0
+            roots.append(offset)
+            left.append(np.where(is_leaf, -1, tree_left + offset))
+            right.append(np.where(is_leaf, -1, tree_right + offset))
+            # У листьев split_conditions хранит значение листа
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            feature.append(np.where(is_leaf, 0, tree['split_indices']))
+            threshold.append(np.where(is_leaf, 0, conditions))
+            value.append(np.where(is_leaf, conditions, 0))
+            default_left.append(np.asarray(tree['default_left'], dtype=bool))
+
+            # Родитель всегда имеет меньший индекс, чем потомки
+            depth = np.zeros(len(tree_left), dtype=np.int32)
+            for node in np.flatnonzero(~is_leaf):
+                depth[tree_left[node]] = depth[tree_right[node]] = depth[node] + 1
+            max_depth = max(max_depth, int(depth.max()))
+            offset += len(tree_left)
+
+        return cls(
+            np.concatenate(left), np.concatenate(right), np.concatenate(feature),
+            np.concatenate(threshold), np.concatenate(default_left), np.concatenate(value),
+            roots, np.log(base_score / (1 - base_score)), max_depth, feature_names
+        )
+
+    def save(self, path):
+        np.savez(
+            path, left=self.left, right=self.right, feature=self.feature,
+            threshold=self.threshold, default_left=self.default_left, value=self.value,
+            roots=self.roots, base_margin=self.base_margin, max_depth=self.max_depth,
+            feature_names=np.array(self.feature_names), source_version=self.source_version
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data['left'], data['right'], data['feature'], data['threshold'],
+                data['default_left'], data['value'], data['roots'],
+                data['base_margin'], data['max_depth'], data['feature_names'].tolist(),
+                str(data['source_version']) if 'source_version' in data else ''
+            )
+
+    def predict_margin(self, X):
+        """Raw margin for X [n_rows, n_features], evaluated in PREDICT_CHUNK_ROWS row chunks."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        if len(X) <= PREDICT_CHUNK_ROWS:
+            return self._chunk_margin(X)
+        return np.concatenate([self._chunk_margin(X[i:i + PREDICT_CHUNK_ROWS])
+                               for i in range(0, len(X), PREDICT_CHUNK_ROWS)])
+
+    def _chunk_margin(self, X):
+        """Raw margin of one chunk: all trees are walked level by level."""
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            left = self.left[node]
+            x = X[rows, self.feature[node]]
+            # XGBoost: x < threshold -> left, NaN -> default direction
+            go_left = np.where(np.isnan(x), self.default_left[node], x < self.threshold[node])
+            node = np.where(left < 0, node, np.where(go_left, left, self.right[node]))
+        return self.base_margin + self.value[node].sum(axis=1, dtype=np.float64)
+
+    def predict_proba(self, X):
+        """[n_rows, 2] class probabilities, like XGBClassifier.predict_proba."""
+        proba = 1 / (1 + np.exp(-self.predict_margin(X)))
+        return np.column_stack([1 - proba, proba])
+
+    def predict(self, X):
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(int)
+
+
+def parity_sample(ensemble, n_rows=10000, seed=42):
+    """Random rows spanning every split threshold, with some NaN values."""
+    rng = np.random.default_rng(seed)
+    n_features = len(ensemble.feature_names) or int(ensemble.feature.max()) + 1
+    X = np.zeros((n_rows, n_features), dtype=np.float32)
+    inner = ensemble.left >= 0
+    for f in range(n_features):
+        thresholds = ensemble.threshold[inner & (ensemble.feature == f)]
+        if len(thresholds):
+            # Половина значений - ровно пороги, половина - равномерно вокруг них
+            lo, hi = thresholds.min() - 1, thresholds.max() + 1
+            X[:, f] = np.where(rng.random(n_rows) < 0.5, rng.choice(thresholds, n_rows),
+                               rng.uniform(lo, hi, n_rows))
+    X[rng.random(X.shape) < 0.02] = np.nan
+    return X
+
+
+def check_parity(model, ensemble, X, tol=PARITY_TOLERANCE):
+    """Max |difference| of class-1 probabilities; raises if above tol."""
+    expected = model.predict_proba(X)[:, 1]
+    actual = ensemble.predict_proba(X)[:, 1]
+    diff = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+    if diff > tol:
+        raise ValueError(f"Tree export mismatch: max |diff| = {diff:.2e} > {tol:.0e}")
+    return diff
+
+
+def export_model(model, path=TREES_PATH, X_check=None, source_version=''):
+    """Export an XGBClassifier to path and verify it against predict_proba."""
+    ensemble = TreeEnsemble.from_booster(model.get_booster())
+    ensemble.source_version = source_version
+    if X_check is None:
+        X_check = parity_sample(ensemble)
+    diff = check_parity(model, ensemble, np.asarray(X_check, dtype=np.float32))
+    ensemble.save(path)
+    return ensemble, diff
+
+
+def main():
+    import joblib
+    from booster_model import BOOSTER_PATH, export_booster
+    from prediction_cache import file_hash
+
+    model_path = os.path.join(MODEL_DIR, 'model.pkl')
+    model = joblib.load(model_path)
+    version = file_hash(model_path)
+    ensemble, diff = export_model(model, source_version=version)
+    export_booster(model, BOOSTER_PATH, source_version=version)
+    print(f"Exported {len(ensemble.roots)} trees ({len(ensemble.left)} nodes) to {TREES_PATH}")
+    print(f"Parity with predict_proba: max |diff| = {diff:.2e}")
+    print(f"Native booster saved to {BOOSTER_PATH}")
+
+
+if __name__ == '__main__':
+    main()
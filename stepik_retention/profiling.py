@@ -0,0 +1,100 @@
+"""
+Stepik Retention - Stage profiling
+Замеры стадий пайплайна: время, строки на входе/выходе, прирост и пик RSS.
+Стадии пишутся в общий список процесса; train_model.py и precompute_features.py
+печатают сводку в конце и сохраняют её в JSON по --profile.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+STAGES = []
+_depth = 0
+
+
+def _reset_peak_rss():
+    """Reset VmHWM to the current RSS (Linux); elsewhere the peak is process-wide."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    """Peak resident set size in MB since the last reset."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return None
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return None
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Record one pipeline stage; the body may set record['rows_out'].
+    Вложенные стадии записываются отдельно (время внешней включает их, depth > 0);
+    пик RSS сбрасывается только внешней стадией, у вложенных он отсчитан от её начала.
+    """
+    global _depth
+    record = {'stage': name, 'depth': _depth, 'rows_in': rows_in, 'rows_out': None}
+    if _depth == 0:
+        _reset_peak_rss()
+    rss_before = rss_mb()
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        _depth -= 1
+        rss_after = rss_mb()
+        record['rss_mb'] = rss_after
+        record['rss_delta_mb'] = (None if rss_before is None or rss_after is None
+                                  else rss_after - rss_before)
+        record['peak_rss_mb'] = peak_rss_mb()
+        STAGES.append(record)
+
+
+def reset():
+    STAGES.clear()
+
+
+def _fmt(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+def print_report():
+    """Table of the recorded stages in completion order."""
+    print(f"\n{'stage':<28}{'seconds':>10}{'rows in':>12}{'rows out':>12}{'ΔRSS MB':>10}")
+    for r in STAGES:
+        print(f"{'  ' * r['depth'] + r['stage']:<28}{r['seconds']:>10.3f}{_fmt(r['rows_in'], 'd'):>12}"
+              f"{_fmt(r['rows_out'], 'd'):>12}{_fmt(r['rss_delta_mb'], '.1f'):>10}")
+
+
+def save_report(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(STAGES, f, indent=2)
@@ -0,0 +1,202 @@
+"""
+Stepik Retention - Streaming ingestion
+Чтение event_data_train.csv / submissions_data_train.csv чанками с компактными
+типами и накопление агрегатов по пользователям. Пиковая память ограничена
+числом пользователей (и пар пользователь-шаг), а не числом событий.
+"""
+import numpy as np
+import pandas as pd
+
+from features import (
+    SECONDS_PER_DAY, WINDOW_SEC, add_poly_features, finalize_base_features,
+    lookup_users, user_activity
+)
+
+EVENTS_DTYPES = {
+    'step_id': 'int32', 'timestamp': 'int64', 'action': 'category', 'user_id': 'int32'
+}
+SUBMISSIONS_DTYPES = {
+    'step_id': 'int32', 'timestamp': 'int64', 'submission_status': 'category', 'user_id': 'int32'
+}
+DEFAULT_CHUNKSIZE = 1_000_000
+
+
+def read_chunks(path, dtypes, chunksize=DEFAULT_CHUNKSIZE):
+    """Iterate over a CSV in chunks with compact dtypes."""
+    return pd.read_csv(path, dtype=dtypes, usecols=list(dtypes), chunksize=chunksize)
+
+
+def _combine(acc, part, agg):
+    """Merge per-user partial aggregates (indexed by user_id)."""
+    if acc is None:
+        return part
+    return pd.concat([acc, part]).groupby(level=0).agg(agg)
+
+
+def _empty(columns):
+    """Empty per-user frame with float columns."""
+    return pd.DataFrame(
+        {c: pd.Series(dtype=np.float64) for c in columns},
+        index=pd.Index([], dtype='int64', name='user_id')
+    )
+
+
+def _keep_first(df, keys):
+    """Stable sort by keys and keep the first row per keys[:-1] group."""
+    order = np.lexsort([df[k].to_numpy() for k in reversed(keys)])
+    return df.take(order).drop_duplicates(keys[:-1], keep='first')
+
+
+class FeatureAccumulator:
+    """
+    Running per-user state for the 3-day window features.
+    activity (min_timestamp по пользователю) должен быть известен заранее:
+    окно отсчитывается от первого события пользователя.
+    """
+    EVENT_AGG = {
+        'viewed': 'sum', 'passed': 'sum', 'total_events': 'sum',
+        'first_day_events': 'sum', 'last_event_ts': 'max',
+    }
+    SUBMISSION_AGG = {'correct': 'sum', 'wrong': 'sum'}
+    ACTIVITY_AGG = {'min_timestamp': 'min', 'last_timestamp': 'max', 'passed_total': 'sum'}
+
+    def __init__(self, activity=None, track_touched=False):
+        self.activity = activity
+        self.events = None          # счётчики событий по пользователю
+        self.submissions = None     # correct / wrong по пользователю
+        self.sub_days = None        # уникальные пары (user_id, day)
+        self.first_attempts = None  # первая попытка по (user_id, step_id)
+        self.last_sub = None        # последний сабмит по user_id
+        # user_id со строками в окне после reset_touched(); копятся только при track_touched
+        self.track_touched = track_touched
+        self.touched = np.empty(0, dtype=np.int64)
+
+    def add_activity(self, events):
+        """Update min/max timestamp and passed totals from raw events."""
+        self.activity = _combine(self.activity, user_activity(events), self.ACTIVITY_AGG)
+
+    def reset_touched(self):
+        self.touched = np.empty(0, dtype=np.int64)
+
+    def touched_users(self):
+        """Users that got rows inside their window since reset_touched() (if tracked)."""
+        return self.touched
+
+    def prune(self, now):
+        """
+        Drop detailed state of users whose 3-day window closed before now.
+        Их признаки больше не меняются; activity сохраняется, чтобы поздние
+        события не открыли окно заново.
+        """
+        open_users = self.activity.index[self.activity['min_timestamp'] + WINDOW_SEC >= now]
+        if self.events is not None:
+            self.events = self.events[self.events.index.isin(open_users)]
+        if self.submissions is not None:
+            self.submissions = self.submissions[self.submissions.index.isin(open_users)]
+        for name in ('sub_days', 'first_attempts', 'last_sub'):
+            df = getattr(self, name)
+            if df is not None:
+                setattr(self, name, df[df['user_id'].isin(open_users)])
+
+    def _window(self, chunk):
+        """Keep rows inside the user's 3-day window; return them with min_timestamp."""
+        min_ts = lookup_users(
+            self.activity.index.to_numpy(), chunk['user_id'].to_numpy(),
+            self.activity['min_timestamp'].to_numpy(), np.nan
+        )
+        mask = chunk['timestamp'].to_numpy() <= min_ts + WINDOW_SEC
+        chunk = chunk[mask]
+        if self.track_touched:
+            # Уникальные id, а не строки чанка: память ограничена числом пользователей
+            self.touched = np.union1d(self.touched, chunk['user_id'].to_numpy().astype(np.int64))
+        return chunk, min_ts[mask]
+
+    def add_events(self, chunk):
+        chunk, min_ts = self._window(chunk)
+        ts = chunk['timestamp'].to_numpy()
+        part = pd.DataFrame({
+            'user_id': chunk['user_id'].to_numpy(),
+            'viewed': (chunk['action'] == 'viewed').to_numpy(),
+            'passed': (chunk['action'] == 'passed').to_numpy(),
+            'total_events': 1,
+            'first_day_events': ts < min_ts + SECONDS_PER_DAY,
+            'last_event_ts': ts,
+        }).groupby('user_id').agg(self.EVENT_AGG)
+        self.events = _combine(self.events, part, self.EVENT_AGG)
+
+    def add_submissions(self, chunk):
+        chunk, _ = self._window(chunk)
+        status = chunk['submission_status']
+        subs = pd.DataFrame({
+            'user_id': chunk['user_id'].to_numpy(),
+            'step_id': chunk['step_id'].to_numpy(),
+            'timestamp': chunk['timestamp'].to_numpy(),
+            'correct': (status == 'correct').to_numpy(),
+            'wrong': (status == 'wrong').to_numpy(),
+        })
+        part = subs.groupby('user_id').agg(self.SUBMISSION_AGG)
+        self.submissions = _combine(self.submissions, part, self.SUBMISSION_AGG)
+
+        days = pd.DataFrame({'user_id': subs['user_id'], 'day': subs['timestamp'] // SECONDS_PER_DAY})
+        self.sub_days = pd.concat([self.sub_days, days]).drop_duplicates()
+
+        # Накопленное состояние идёт первым: при равных timestamp побеждает
+        # более ранняя строка файла
+        attempts = subs[['user_id', 'step_id', 'timestamp', 'correct']]
+        self.first_attempts = _keep_first(
+            pd.concat([self.first_attempts, attempts]), ['user_id', 'step_id', 'timestamp']
+        )
+        last = subs[['user_id', 'timestamp', 'correct']].assign(neg_ts=-subs['timestamp'])
+        self.last_sub = _keep_first(
+            pd.concat([self.last_sub, last]), ['user_id', 'neg_ts']
+        )
+
+    def base_features(self, users=None):
+        """BASE_FEATURES for users with submissions in their window (optionally only users)."""
+        if self.submissions is None:
+            subs = _empty(list(self.SUBMISSION_AGG))
+        else:
+            subs = self.submissions.astype(np.float64)
+            subs['days'] = self.sub_days.groupby('user_id').size()
+            attempts = self.first_attempts.groupby('user_id')['correct']
+            subs['steps_tried'] = attempts.size()
+            subs['first_try_correct'] = attempts.sum()
+            subs['last_sub_correct'] = self.last_sub.set_index('user_id')['correct']
+
+        if self.events is None:
+            events = _empty(list(self.EVENT_AGG))
+        else:
+            events = self.events.astype(np.float64)
+        min_ts = self.activity['min_timestamp'].reindex(events.index)
+        events['active_hours'] = (events.pop('last_event_ts') - min_ts) / 3600
+        if users is not None:
+            subs = subs[subs.index.isin(users)]
+        return finalize_base_features(subs.astype(np.float64), events)
+
+
+def stream_activity(events_path, chunksize=DEFAULT_CHUNKSIZE):
+    """Pass 1: per-user min/max timestamp and total passed over all events."""
+    acc = FeatureAccumulator()
+    for chunk in read_chunks(events_path, EVENTS_DTYPES, chunksize):
+        acc.add_activity(chunk)
+    return acc.activity
+
+
+def stream_base_features(events_path, submissions_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Потоковый расчёт 13 базовых признаков: (X, activity).
+    События читаются дважды: сначала для min_timestamp, затем для окна 3 дней.
+    """
+    activity = stream_activity(events_path, chunksize)
+    acc = FeatureAccumulator(activity)
+    for chunk in read_chunks(events_path, EVENTS_DTYPES, chunksize):
+        acc.add_events(chunk)
+    for chunk in read_chunks(submissions_path, SUBMISSIONS_DTYPES, chunksize):
+        acc.add_submissions(chunk)
+    return acc.base_features(), activity
+
+
+def stream_features(events_path, submissions_path, chunksize=DEFAULT_CHUNKSIZE):
+    """Потоковый аналог features.build_features: (X с 19 признаками, activity)."""
+    X, activity = stream_base_features(events_path, submissions_path, chunksize)
+    return add_poly_features(X), activity
@@ -1,31 +1,44 @@
 """
 Stepik Retention Model - Training script
 Обучает лучшую XGBoost модель (XGB Best ROC-AUC) с полиномиальными признаками.
-Сохраняет model.pkl, feature_config.pkl, poly.pkl для инференса.
+Сохраняет model.pkl, feature_config.pkl, model.ubj и model_trees.npz для инференса
+и публикует их новой версией в models/registry; с --activate (или если CURRENT ещё
+нет) версия становится CURRENT и сервис подхватывает её без рестарта.
+В конце печатает время, строки и прирост памяти по стадиям (--profile - в JSON).
 """
-import pandas as pd
 import numpy as np
 from xgboost import XGBClassifier
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import PolynomialFeatures
 import joblib
+import argparse
+import json
 import os
+import time
+
+from features import (
+    BASE_FEATURES, EVENT_COLUMNS, FEATURE_COLUMNS, SELECTED_POLY, SUBMISSION_COLUMNS, add_poly_features,
+    build_features_parallel,
+    filter_first_days, compute_base_features, select_training_users, sort_by_user,
+    user_activity, user_targets
+)
+from log_cache import load_log
+import profiling
+from profiling import stage
+from model_service import model_registry
+from model_service.booster_model import BOOSTER_PATH, export_booster
+from model_service.feature_store import feature_version
+from model_service.prediction_cache import file_hash
+from model_service.tree_model import TREES_PATH, export_model
+from streaming import DEFAULT_CHUNKSIZE, EVENTS_DTYPES, SUBMISSIONS_DTYPES, stream_base_features
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 EVENTS_PATH = os.path.join(BASE_DIR, 'event_data_train.csv')
 SUBMISSIONS_PATH = os.path.join(BASE_DIR, 'submissions_data_train.csv')
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_service', 'models')
+SEARCH_DIR = os.path.join(BASE_DIR, 'search_results')
+CANARY_ROWS = 256
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-BASE_FEATURES = [
-    'days', 'steps_tried', 'correct', 'wrong', 'correct_ratio', 'viewed', 'passed',
-    'view_to_pass_ratio', 'first_try_ratio', 'active_hours', 'last_sub_correct',
-    'attempts_per_step', 'first_day_ratio'
-]
-SELECTED_POLY = [
-    'view_to_pass_ratio active_hours', 'days first_try_ratio', 'wrong viewed',
-    'days wrong', 'wrong^2', 'steps_tried viewed'
-]
 # Лучшие параметры из notebook (XGB Best ROC-AUC)
 XGB_PARAMS = {
     'subsample': 0.9, 'reg_lambda': 1, 'reg_alpha': 1, 'n_estimators': 400,
@@ -35,199 +48,201 @@ XGB_PARAMS = {
 
 
 def load_and_prepare_data():
-    """Load events and submissions, prepare users_data with min_timestamp."""
+    """Load events and submissions, keep the first 3 days, prepare users_data targets."""
     print("Loading data...")
-    events_data = pd.read_csv(EVENTS_PATH)
-    submissions_data = pd.read_csv(SUBMISSIONS_PATH)
-
-    events_data['date'] = pd.to_datetime(events_data.timestamp, unit='s')
-    events_data['day'] = events_data.date.dt.date
-    submissions_data['date'] = pd.to_datetime(submissions_data.timestamp, unit='s')
-    submissions_data['day'] = submissions_data.date.dt.date
-
-    # users_data with last_timestamp, is_gone_user, passed_course
-    users_data = events_data.groupby('user_id', as_index=False).agg(
-        {'timestamp': 'max'}).rename(columns={'timestamp': 'last_timestamp'})
-    now = events_data.timestamp.max()
-    drop_out_threshold = 30 * 24 * 60 * 60  # 30 days
-    users_data['is_gone_user'] = (now - users_data.last_timestamp) > drop_out_threshold
-
-    # users_score from submissions
-    users_score = submissions_data.pivot_table(
-        index="user_id", columns="submission_status", values="step_id",
-        aggfunc="count", fill_value=0
-    ).reset_index()
-    users_data = users_data.merge(users_score, on='user_id', how='outer')
-    users_data = users_data.fillna(0)
-
-    # users_events_data
-    users_events_data = events_data.pivot_table(
-        index="user_id", columns="action", values="step_id",
-        aggfunc="count", fill_value=0
-    ).reset_index()
-    users_data = users_data.merge(users_events_data, on='user_id', how='outer')
-    users_data = users_data.fillna(0)
-
-    # users_days
-    users_days = events_data.groupby('user_id').day.nunique().to_frame().reset_index()
-    users_days = users_days.rename(columns={'day': 'day'})
-    users_data = users_data.merge(users_days, on='user_id', how='outer')
-    users_data = users_data.fillna(0)
-
-    users_data['passed_course'] = users_data.passed > 170
-
-    # user_min_time
-    user_min_time = events_data.groupby('user_id', as_index=False).agg(
-        {'timestamp': 'min'}).rename(columns={'timestamp': 'min_timestamp'})
-    users_data = users_data.merge(user_min_time, on='user_id', how='outer')
-
-    # Filter events and submissions to first 3 days
-    three_days_sec = 3 * 24 * 60 * 60
-    events_with_min = events_data.merge(user_min_time, on='user_id', how='left')
-    events_with_min['max_timestamp'] = events_with_min['min_timestamp'] + three_days_sec
-    events_data_train = events_with_min[
-        events_with_min['timestamp'] <= events_with_min['max_timestamp']
-    ].drop(columns=['min_timestamp', 'max_timestamp'], errors='ignore')
-
-    sub_merged = submissions_data.merge(
-        users_data[['user_id', 'min_timestamp']], on='user_id', how='left'
-    )
-    mask = (sub_merged['min_timestamp'].notna() &
-            (sub_merged['timestamp'] <= sub_merged['min_timestamp'] + three_days_sec))
-    submissions_data_train = submissions_data[mask].copy()
+    with stage('load') as record:
+        events_data = load_log(EVENTS_PATH, EVENTS_DTYPES, columns=EVENT_COLUMNS)
+        submissions_data = load_log(SUBMISSIONS_PATH, SUBMISSIONS_DTYPES, columns=SUBMISSION_COLUMNS)
+        record['rows_out'] = len(events_data) + len(submissions_data)
+
+    with stage('window_filter', rows_in=record['rows_out']) as record:
+        events_data = sort_by_user(events_data)
+        activity = user_activity(events_data)
+        events_data_train, submissions_data_train = filter_first_days(
+            events_data, submissions_data, activity
+        )
+        record['rows_out'] = len(events_data_train) + len(submissions_data_train)
+    # users_data: passed_course, is_gone_user (индекс user_id)
+    users_data = user_targets(activity)
 
     return events_data_train, submissions_data_train, users_data
 
 
 def compute_features(events_data_train, submissions_data_train, users_data):
     """Compute feature matrix X and target y."""
-    # Base features from submissions
-    X = submissions_data_train.groupby('user_id').day.nunique().to_frame().reset_index()
-    X = X.rename(columns={'day': 'days'})
-
-    steps_tried = submissions_data_train.groupby('user_id').step_id.nunique().to_frame().reset_index()
-    steps_tried = steps_tried.rename(columns={'step_id': 'steps_tried'})
-    X = X.merge(steps_tried, on='user_id', how='outer')
-
-    sub_pivot = submissions_data_train.pivot_table(
-        index="user_id", columns="submission_status", values="step_id",
-        aggfunc="count", fill_value=0
-    ).reset_index()
-    X = X.merge(sub_pivot[['user_id', 'correct', 'wrong']], on='user_id', how='outer')
-    X = X.fillna(0)
-    X['correct_ratio'] = X['correct'] / (X['correct'] + X['wrong'] + 1e-10)
-
-    # viewed from events
-    events_pivot = events_data_train.pivot_table(
-        index="user_id", columns="action", values="step_id",
-        aggfunc="count", fill_value=0
-    ).reset_index()
-    X = X.merge(events_pivot[['user_id', 'viewed']], on='user_id', how='left')
-    X['viewed'] = X['viewed'].fillna(0)
-
-    # passed
-    X = X.merge(events_pivot[['user_id', 'passed']], on='user_id', how='left')
-    X['passed'] = X['passed'].fillna(0)
-
-    X['view_to_pass_ratio'] = X['passed'] / (X['viewed'] + 1)
-
-    # first_try_ratio
-    first_attempts = submissions_data_train.sort_values('timestamp').drop_duplicates(
-        subset=['user_id', 'step_id'], keep='first'
-    )
-    first_try_correct = first_attempts[first_attempts['submission_status'] == 'correct'].groupby(
-        'user_id'
-    ).size().reset_index(name='first_try_correct')
-    X = X.merge(first_try_correct, on='user_id', how='left')
-    X['first_try_correct'] = X['first_try_correct'].fillna(0)
-    X['first_try_ratio'] = X['first_try_correct'] / (X['steps_tried'] + 1)
-    X = X.drop('first_try_correct', axis=1)
-
-    # active_hours
-    time_features = events_data_train.groupby('user_id')['timestamp'].agg(['min', 'max']).reset_index()
-    time_features['active_hours'] = (time_features['max'] - time_features['min']) / 3600
-    X = X.merge(time_features[['user_id', 'active_hours']], on='user_id', how='left')
-    X['active_hours'] = X['active_hours'].fillna(0)
-
-    # last_sub_correct
-    last_sub_idx = submissions_data_train.groupby('user_id')['timestamp'].idxmax()
-    last_sub = submissions_data_train.loc[last_sub_idx][['user_id', 'submission_status']]
-    last_sub['last_sub_correct'] = (last_sub['submission_status'] == 'correct').astype(int)
-    X = X.merge(last_sub[['user_id', 'last_sub_correct']], on='user_id', how='left')
-    X['last_sub_correct'] = X['last_sub_correct'].fillna(0)
-
-    X['attempts_per_step'] = (X['correct'] + X['wrong']) / (X['steps_tried'] + 1)
-
-    # first_day_ratio
-    events_with_min = events_data_train.merge(
-        time_features[['user_id', 'min']].rename(columns={'min': 'first_ts'}), on='user_id'
-    )
-    first_day_events = events_with_min[
-        events_with_min['timestamp'] < events_with_min['first_ts'] + 86400
-    ].groupby('user_id').size().reset_index(name='first_day_events')
-    total_events = events_data_train.groupby('user_id').size().reset_index(name='total_events')
-    X = X.merge(first_day_events, on='user_id', how='left')
-    X = X.merge(total_events, on='user_id', how='left')
-    X['first_day_events'] = X['first_day_events'].fillna(0)
-    X['total_events'] = X['total_events'].fillna(1)
-    X['first_day_ratio'] = X['first_day_events'] / X['total_events']
-    X = X.drop(['first_day_events', 'total_events'], axis=1)
-
-    # Merge with users_data for target
-    X = X.merge(users_data[['user_id', 'passed_course', 'is_gone_user']], how='outer')
-
+    X = compute_base_features(events_data_train, submissions_data_train)
     # Filter: exclude users who are still active (not gone) and didn't pass
-    X = X[~((X.is_gone_user == False) & (X.passed_course == False))]
+    with stage('select_users', rows_in=len(X)) as record:
+        X, y = select_training_users(X, users_data)
+        record['rows_out'] = len(X)
+    return X, y
 
-    y = X.passed_course.map(int)
-    X = X.drop(['passed_course', 'is_gone_user'], axis=1)
-    X = X[BASE_FEATURES].fillna(0)
 
-    return X, y
+def load_features_streaming(chunksize):
+    """Compute X and y reading the CSVs in chunks (bounded memory)."""
+    print(f"Streaming data in chunks of {chunksize} rows...")
+    with stage('stream_features') as record:
+        X, activity = stream_base_features(EVENTS_PATH, SUBMISSIONS_PATH, chunksize)
+        record['rows_out'] = len(X)
+    return select_training_users(X, user_targets(activity))
+
+
+def load_features_parallel(workers):
+    """Compute X and y on user_id shards in a pool of worker processes."""
+    print(f"Loading data, computing features with {workers} workers...")
+    with stage('load') as record:
+        events_data = load_log(EVENTS_PATH, EVENTS_DTYPES, columns=EVENT_COLUMNS)
+        submissions_data = load_log(SUBMISSIONS_PATH, SUBMISSIONS_DTYPES, columns=SUBMISSION_COLUMNS)
+        record['rows_out'] = len(events_data) + len(submissions_data)
+    with stage('features_parallel', rows_in=record['rows_out']) as record:
+        X, activity = build_features_parallel(events_data, submissions_data, workers, poly=False)
+        record['rows_out'] = len(X)
+    # Целевая переменная - по всем пользователям сразу (now - общий максимум)
+    return select_training_users(X, user_targets(activity))
+
+
+def load_training_data(args):
+    """X (13 base features) and y using the ingestion mode selected on the command line."""
+    if args.stream:
+        return load_features_streaming(args.chunksize)
+    if args.workers > 1:
+        return load_features_parallel(args.workers)
+    events_data_train, submissions_data_train, users_data = load_and_prepare_data()
+    print(f"Events (first 3 days): {len(events_data_train)} rows")
+    print(f"Submissions (first 3 days): {len(submissions_data_train)} rows")
+    return compute_features(events_data_train, submissions_data_train, users_data)
+
+
+def run_search(X_train, y_train, args):
+    """Hyperparameter search on the training split; writes the results table and best params."""
+    from hyperparam_search import save_results, successive_halving
+
+    results, best_params = successive_halving(
+        X_train, y_train, n_configs=args.configs, n_folds=args.folds, eta=args.eta,
+        min_rounds=args.min_rounds, max_rounds=args.max_rounds
+    )
+    results_path, params_path = save_results(results, best_params, SEARCH_DIR)
+    print(f"\nBest XGB_PARAMS: {best_params}")
+    print(f"Results saved to {results_path}, best params to {params_path}")
+
+
+def finish_profile(args):
+    profiling.print_report()
+    if args.profile:
+        profiling.save_report(args.profile)
+        print(f"Stage profile saved to {args.profile}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the Stepik retention model")
+    parser.add_argument('command', nargs='?', choices=['train', 'search'], default='train',
+                        help="train the model (default) or search XGB_PARAMS")
+    parser.add_argument('--stream', action='store_true',
+                        help="read CSVs in chunks with bounded memory")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help="rows per chunk in --stream mode")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes for per-user-shard feature computation")
+    parser.add_argument('--params', help="JSON with XGB_PARAMS (e.g. from the search command)")
+    parser.add_argument('--profile', help="write per-stage timings to this JSON file")
+    parser.add_argument('--activate', action='store_true',
+                        help="make the new version CURRENT (live on all replicas); by default "
+                             "it is only published unless the registry has no CURRENT yet")
+    search = parser.add_argument_group('search')
+    search.add_argument('--configs', type=int, default=27, help="random configurations to try")
+    search.add_argument('--folds', type=int, default=5, help="stratified CV folds")
+    search.add_argument('--eta', type=int, default=3, help="successive halving keeps 1/eta per rung")
+    search.add_argument('--min-rounds', type=int, default=100, help="trees on the first rung")
+    search.add_argument('--max-rounds', type=int, default=900, help="maximum trees per configuration")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     print("Stepik Retention Model - Training")
     print("=" * 50)
 
-    events_data_train, submissions_data_train, users_data = load_and_prepare_data()
-    print(f"Events (first 3 days): {len(events_data_train)} rows")
-    print(f"Submissions (first 3 days): {len(submissions_data_train)} rows")
-
-    X, y = compute_features(events_data_train, submissions_data_train, users_data)
+    X, y = load_training_data(args)
     print(f"Training samples: {len(X)}")
     print(f"Class balance: {y.value_counts().to_dict()}")
 
-    # Полиномиальные признаки (как в notebook)
-    poly = PolynomialFeatures(degree=2, include_bias=False, interaction_only=False)
-    X_poly = poly.fit_transform(X)
-    poly_names = poly.get_feature_names_out(BASE_FEATURES)
-    X_poly_df = pd.DataFrame(X_poly, columns=poly_names, index=X.index)
-    X_final = pd.concat([X, X_poly_df[SELECTED_POLY]], axis=1)
+    # Полиномиальные признаки (как в notebook): только SELECTED_POLY
+    X_final = add_poly_features(X)
 
     X_train, X_test, y_train, y_test = train_test_split(
         X_final, y, test_size=0.2, random_state=42, stratify=y
     )
+    if args.command == 'search':
+        with stage('search', rows_in=len(X_train)):
+            run_search(X_train, y_train, args)
+        finish_profile(args)
+        return
+
+    xgb_params = XGB_PARAMS
+    if args.params:
+        with open(args.params, encoding='utf-8') as f:
+            xgb_params = json.load(f)
+        print(f"XGB_PARAMS from {args.params}: {xgb_params}")
 
     scale_pos_weight = len(y_train[y_train == 0]) / max(len(y_train[y_train == 1]), 1)
     model = XGBClassifier(
         scale_pos_weight=scale_pos_weight, random_state=42, n_jobs=-1,
-        eval_metric='logloss', **XGB_PARAMS
+        eval_metric='logloss', **xgb_params
     )
-    model.fit(X_train, y_train)
+    with stage('fit', rows_in=len(X_train)):
+        model.fit(X_train, y_train)
 
     from sklearn.metrics import accuracy_score, roc_auc_score
-    y_pred = model.predict(X_test)
-    y_proba = model.predict_proba(X_test)[:, 1]
-    print(f"\nTest Accuracy: {accuracy_score(y_test, y_pred):.4f}")
-    print(f"Test ROC-AUC: {roc_auc_score(y_test, y_proba):.4f}")
-
-    joblib.dump(model, os.path.join(OUTPUT_DIR, 'model.pkl'))
-    joblib.dump({'base_features': BASE_FEATURES, 'selected_poly_features': SELECTED_POLY},
-                os.path.join(OUTPUT_DIR, 'feature_config.pkl'))
-    joblib.dump(poly, os.path.join(OUTPUT_DIR, 'poly.pkl'))
+    with stage('evaluate', rows_in=len(X_test)):
+        y_pred = model.predict(X_test)
+        y_proba = model.predict_proba(X_test)[:, 1]
+    accuracy, roc_auc = accuracy_score(y_test, y_pred), roc_auc_score(y_test, y_proba)
+    print(f"\nTest Accuracy: {accuracy:.4f}")
+    print(f"Test ROC-AUC: {roc_auc:.4f}")
+
+    model_path = os.path.join(OUTPUT_DIR, 'model.pkl')
+    with stage('dump'):
+        joblib.dump(model, model_path)
+        joblib.dump({'base_features': BASE_FEATURES, 'selected_poly_features': SELECTED_POLY},
+                    os.path.join(OUTPUT_DIR, 'feature_config.pkl'))
+        # Деревья в плоских массивах для MODEL_BACKEND=trees (проверка на X_test)
+        model_version = file_hash(model_path)
+        _, diff = export_model(model, TREES_PATH, X_check=X_test.to_numpy(dtype=np.float32),
+                               source_version=model_version)
+        # Нативный формат XGBoost: сервис грузит его без joblib и sklearn
+        export_booster(model, BOOSTER_PATH, source_version=model_version)
+    print(f"Trees exported to {TREES_PATH} (max |diff| vs predict_proba: {diff:.2e})")
+    print(f"Native booster saved to {BOOSTER_PATH}")
     print(f"\nМодель сохранена в {OUTPUT_DIR}")
 
+    with stage('publish'):
+        # Канареечный батч: сервис сверяет с ним новую версию перед подменой
+        X_canary = X_test.to_numpy(dtype=np.float32)[:CANARY_ROWS]
+        canary_path = os.path.join(OUTPUT_DIR, model_registry.CANARY_FILE)
+        np.savez(canary_path, X=X_canary, proba=model.predict_proba(X_canary)[:, 1])
+        metadata = {
+            'created_at': time.time(),
+            'roc_auc': float(roc_auc),
+            'accuracy': float(accuracy),
+            'n_train': len(X_train),
+            'n_test': len(X_test),
+            'xgb_params': xgb_params,
+            'feature_columns': FEATURE_COLUMNS,
+            'feature_version': feature_version(FEATURE_COLUMNS),
+        }
+        artifacts = [model_path, os.path.join(OUTPUT_DIR, 'feature_config.pkl'),
+                     BOOSTER_PATH, TREES_PATH, canary_path]
+        # Без --activate версия только публикуется: на сервис её выводит model_registry.py --activate
+        activate = args.activate or model_registry.current_version() is None
+        version_path = model_registry.publish(model_version, artifacts, metadata, activate=activate)
+    print(f"Published model version {model_version} to {version_path}")
+    if activate:
+        print(f"CURRENT -> {model_version}")
+    else:
+        print(f"CURRENT is still {model_registry.current_version()}; to go live run "
+              f"python stepik_retention/model_service/model_registry.py --activate {model_version}")
+    finish_profile(args)
+
 
 if __name__ == '__main__':
     main()